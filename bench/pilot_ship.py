@@ -0,0 +1,104 @@
+"""Benchmark pilot + ship resolution against a live MongoDB.
+
+Compares the original unprojected find_one pair (the baseline), the
+find_pilot + find_ship_by_pilot pair with trimmed projections, the combined
+find_pilot_with_ship resolver and its batched variant. Payload size is the
+BSON size of the raw server replies, as seen by a pymongo command
+listener, so it measures the bytes each strategy moves over the wire.
+
+The card catalog is never loaded here, every lookup queries MongoDB.
+
+Usage:
+    python -m bench.pilot_ship [pilot_xws ...]
+"""
+
+import sys
+import time
+
+import bson
+from pymongo import monitoring
+
+from bot.mongo import search
+from bot.mongo.client import get_collection
+
+DEFAULT_PILOTS = [
+    "oldteroch",
+    "shadowporthunter",
+    "freightercaptain",
+    "spicerunner",
+    "lukeskywalker",
+    "darthvader",
+    "poedameron",
+    "kyloren",
+]
+ROUNDS = 50
+
+
+class ReplySizeListener(monitoring.CommandListener):
+    """Adds up the BSON size of the replies to find/aggregate/getMore."""
+
+    COMMANDS = ("find", "aggregate", "getMore")
+
+    def __init__(self):
+        self.reply_bytes = 0
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        if event.command_name in self.COMMANDS:
+            self.reply_bytes += len(bson.encode(event.reply))
+
+    def failed(self, event):
+        pass
+
+
+# Must be registered before the shared client is created
+listener = ReplySizeListener()
+monitoring.register(listener)
+
+
+def run(label, resolve):
+    listener.reply_bytes = 0
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        resolve()
+    elapsed_ms = (time.perf_counter() - start) * 1000 / ROUNDS
+    reply_bytes = listener.reply_bytes // ROUNDS
+    print(f"{label:<32} {reply_bytes:>10} B {elapsed_ms:>10.2f} ms/list")
+
+
+def resolve_baseline(pilot_ids):
+    # The queries find_pilot and find_ship_by_pilot originally issued,
+    # the latter fetching the whole ship document with all of its pilots
+    pilots = get_collection("pilots")
+    for xws in pilot_ids:
+        pilots.find_one({"pilots.xws": xws}, {"pilots.$": 1, "_id": 0})
+        pilots.find_one({"pilots.xws": xws}, {"_id": 0})
+
+
+def resolve_separately(pilot_ids):
+    for xws in pilot_ids:
+        search.find_pilot(xws)
+        search.find_ship_by_pilot(xws)
+
+
+def resolve_combined(pilot_ids):
+    for xws in pilot_ids:
+        search.find_pilot_with_ship(xws)
+
+
+def resolve_batched(pilot_ids):
+    search.find_pilots_with_ships_many(pilot_ids)
+
+
+if __name__ == "__main__":
+    if not search.warm_up_db_connection():
+        sys.exit("MongoDB is not reachable, nothing to benchmark.")
+    pilots = sys.argv[1:] or DEFAULT_PILOTS
+    print(f"Resolving {len(pilots)} pilots, {ROUNDS} rounds each\n")
+    print(f"{'strategy':<32} {'replies':>12} {'latency':>15}")
+    run("baseline (unprojected find_one)", lambda: resolve_baseline(pilots))
+    run("find_pilot + find_ship_by_pilot", lambda: resolve_separately(pilots))
+    run("find_pilot_with_ship", lambda: resolve_combined(pilots))
+    run("find_pilots_with_ships_many", lambda: resolve_batched(pilots))
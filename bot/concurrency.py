@@ -0,0 +1,430 @@
+"""Asyncio building blocks shared by the message handlers."""
+
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict, deque
+from itertools import islice
+
+from bot import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one task.
+
+    The first caller for a key starts the work, later callers arriving
+    while it runs await the same task and get its result or exception.
+    The key is released as soon as the task finishes, so results are
+    never served stale; caching is left to the callers.
+
+    Args:
+        name (str): Prefix of the metrics counters.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+
+    async def do(self, key, func):
+        """Returns the result of func(), shared by concurrent callers.
+
+        Args:
+            key (Hashable): Identifies identical calls.
+            func (Callable[[], Awaitable]): Starts the work when no call
+                for key is in flight.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            metrics.increment(f"{self.name}.calls")
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+
+            def release(done):
+                if self._calls.get(key) is done:
+                    del self._calls[key]
+
+            task.add_done_callback(release)
+        else:
+            metrics.increment(f"{self.name}.coalesced")
+        # A cancelled caller must not cancel the work the others await
+        return await asyncio.shield(task)
+
+    def __len__(self):
+        return len(self._calls)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Fails fast while a remote service keeps failing.
+
+    While closed, calls go through and consecutive failures are counted.
+    After failure_threshold of them the breaker opens and before_call
+    raises CircuitOpenError for reset_timeout seconds. It then lets a
+    single trial call through (half-open), closing again if it succeeds
+    and reopening if it fails.
+
+    Args:
+        name (str): Prefix of the metrics counters and log messages.
+        failure_threshold (int): Consecutive failures opening the breaker.
+        reset_timeout (float): Seconds to wait before a trial call.
+        clock (Callable[[], float]): Monotonic time source.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name,
+        failure_threshold=5,
+        reset_timeout=30.0,
+        clock=time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = None
+        # A trial call lost to cancellation is retried after reset_timeout
+        self._trial_started_at = None
+
+    def before_call(self):
+        """Checks that a call may go through.
+
+        Raises:
+            CircuitOpenError: If the breaker is open, or half-open with a
+                trial call already in flight.
+        """
+        now = self._clock()
+        if self.state == self.OPEN:
+            if now - self._opened_at < self.reset_timeout:
+                self._reject()
+            self.state = self.HALF_OPEN
+            self._trial_started_at = None
+        if self.state == self.HALF_OPEN:
+            if (
+                self._trial_started_at is not None
+                and now - self._trial_started_at < self.reset_timeout
+            ):
+                self._reject()
+            self._trial_started_at = now
+
+    def _reject(self):
+        metrics.increment(f"{self.name}.rejected")
+        raise CircuitOpenError(f"{self.name} is open")
+
+    def record_success(self):
+        """Closes the breaker after a call the service handled."""
+        if self.state != self.CLOSED:
+            logger.info(f"{self.name} closed.")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trial_started_at = None
+
+    def record_failure(self):
+        """Counts a failed call, opening the breaker past the threshold."""
+        self.failures += 1
+        self._trial_started_at = None
+        if (
+            self.state == self.HALF_OPEN
+            or self.failures >= self.failure_threshold
+        ):
+            if self.state != self.OPEN:
+                metrics.increment(f"{self.name}.opened")
+                logger.warning(
+                    f"{self.name} opened after {self.failures} "
+                    "consecutive failures."
+                )
+            self.state = self.OPEN
+            self._opened_at = self._clock()
+
+
+class OrderedLock:
+    """Serializes a stage of concurrent jobs in their arrival order.
+
+    asyncio.Lock is granted in the order acquire() is called. Here a job
+    takes its turn when it arrives and enters it later, once its
+    concurrent work is done. Turns are entered one at a time, in the order
+    they were taken, so jobs finishing out of order still run the
+    serialized stage in arrival order.
+    """
+
+    def __init__(self):
+        self._tail = None
+
+    def turn(self):
+        """Takes the next turn, to be entered with `async with`."""
+        turn = _Turn(self._tail)
+        self._tail = turn._done
+        return turn
+
+    def locked(self):
+        """Tells whether a turn was taken and is not released yet."""
+        return self._tail is not None and not self._tail.done()
+
+
+class _Turn:
+    """One job's place in an OrderedLock."""
+
+    def __init__(self, previous):
+        self._previous = previous
+        self._done = asyncio.get_running_loop().create_future()
+
+    async def __aenter__(self):
+        if self._previous is not None:
+            # Cancelling this job must not cancel the previous turn
+            await asyncio.shield(self._previous)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+    def release(self):
+        """Passes the turn on once every earlier turn is released.
+
+        Safe to call more than once, and for a turn never entered.
+        """
+        if self._previous is None or self._previous.done():
+            self._finish()
+        else:
+            self._previous.add_done_callback(self._finish)
+
+    def _finish(self, _previous=None):
+        if not self._done.done():
+            self._done.set_result(None)
+
+
+class LockRegistry:
+    """Per-key locks, bounded by evicting the least recently used idle ones.
+
+    Only locks with no turn taken are evicted. An evicted lock holds no
+    waiter, so the fresh lock created when its key comes back orders
+    requests exactly as the evicted one would have. When every lock is
+    busy the registry briefly grows past max_size.
+
+    Args:
+        factory (Callable[[], OrderedLock]): Creates the lock of a new key.
+        max_size (int): Locks kept before idle ones are evicted.
+        name (str): Prefix of the metrics counters.
+    """
+
+    def __init__(self, factory, max_size, name="locks"):
+        self._factory = factory
+        self.max_size = max_size
+        self.name = name
+        self._locks = OrderedDict()
+
+    def get(self, key):
+        """Returns the lock of key, creating it on first use."""
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = self._factory()
+            self._evict(keep=key)
+        else:
+            self._locks.move_to_end(key)
+        return lock
+
+    def _evict(self, keep):
+        excess = len(self._locks) - self.max_size
+        if excess <= 0:
+            return
+        idle = (
+            key
+            for key, lock in self._locks.items()
+            if key != keep and not lock.locked()
+        )
+        evicted = list(islice(idle, excess))
+        for key in evicted:
+            del self._locks[key]
+        metrics.increment(f"{self.name}.evicted", len(evicted))
+
+    def __contains__(self, key):
+        return key in self._locks
+
+    def __len__(self):
+        return len(self._locks)
+
+
+class QueueFullError(Exception):
+    """Raised when the scheduler sheds a job instead of queueing it."""
+
+
+class _Job:
+    __slots__ = ("guild", "user", "func", "future", "queued_at")
+
+    def __init__(self, guild, user, func, queued_at):
+        self.guild = guild
+        self.user = user
+        self.func = func
+        self.future = asyncio.get_running_loop().create_future()
+        self.queued_at = queued_at
+
+
+class FairScheduler:
+    """Bounded work queue shared by every guild.
+
+    At most `workers` jobs run at once, with at most `per_guild` of them
+    from one guild and `per_user` from one user. Queued jobs are started
+    round-robin across guilds, so a busy guild cannot starve the others,
+    and a job is shed with QueueFullError when the global queue or its
+    guild's queue is full.
+
+    Args:
+        workers (int): Jobs running at once.
+        max_queued (int): Jobs waiting across all guilds.
+        max_queued_per_guild (int): Jobs waiting from one guild.
+        per_guild (int): Jobs running at once from one guild.
+        per_user (int): Jobs running at once from one user.
+        name (str): Prefix of the metrics.
+        clock (Callable[[], float]): Monotonic time source.
+    """
+
+    def __init__(
+        self,
+        workers,
+        max_queued,
+        max_queued_per_guild,
+        per_guild,
+        per_user,
+        name="scheduler",
+        clock=time.monotonic,
+    ):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_queued_per_guild = max_queued_per_guild
+        self.per_guild = per_guild
+        self.per_user = per_user
+        self.name = name
+        self._clock = clock
+        # Waiting jobs by guild, a guild is dropped once its queue is empty
+        self._queues = {}
+        # Dispatch number of each active guild's latest job, for round-robin
+        self._last_served = {}
+        self._served = 0
+        self._queued = 0
+        self._running = 0
+        self._running_by_guild = Counter()
+        self._running_by_user = Counter()
+        self._tasks = set()
+
+    @property
+    def queued(self):
+        """Jobs waiting for a worker."""
+        return self._queued
+
+    @property
+    def running(self):
+        """Jobs currently running."""
+        return self._running
+
+    async def submit(self, guild, user, func):
+        """Queues func() and returns its result once a worker ran it.
+
+        Args:
+            guild (Hashable): Guild the job is charged to, None for DMs.
+            user (Hashable): User the job is charged to.
+            func (Callable[[], Awaitable]): Starts the work.
+
+        Raises:
+            QueueFullError: If the job was shed.
+        """
+        queue = self._queues.get(guild)
+        if self._queued >= self.max_queued or (
+            queue is not None and len(queue) >= self.max_queued_per_guild
+        ):
+            metrics.increment(f"{self.name}.shed")
+            raise QueueFullError(f"{self.name} queue is full")
+
+        job = _Job(guild, user, func, self._clock())
+        if queue is None:
+            queue = self._queues[guild] = deque()
+        queue.append(job)
+        self._queued += 1
+        self._dispatch()
+        try:
+            # A cancelled submitter must not cancel a job already running
+            return await asyncio.shield(job.future)
+        except asyncio.CancelledError:
+            self._discard(job)
+            raise
+
+    def _discard(self, job):
+        """Removes a job whose submitter went away before it started."""
+        queue = self._queues.get(job.guild)
+        if queue is not None and job in queue:
+            queue.remove(job)
+            self._queued -= 1
+            if not queue:
+                del self._queues[job.guild]
+                if job.guild not in self._running_by_guild:
+                    self._last_served.pop(job.guild, None)
+
+    def _next_job(self):
+        """Pops the next runnable job of the least recently served guild."""
+        guilds = sorted(
+            self._queues, key=lambda guild: self._last_served.get(guild, 0)
+        )
+        for guild in guilds:
+            if self._running_by_guild[guild] >= self.per_guild:
+                continue
+            queue = self._queues[guild]
+            for job in queue:
+                if self._running_by_user[job.user] < self.per_user:
+                    queue.remove(job)
+                    self._queued -= 1
+                    if not queue:
+                        del self._queues[guild]
+                    self._served += 1
+                    self._last_served[guild] = self._served
+                    return job
+        return None
+
+    def _dispatch(self):
+        while self._running < self.workers:
+            job = self._next_job()
+            if job is None:
+                return
+            self._running += 1
+            self._running_by_guild[job.guild] += 1
+            self._running_by_user[job.user] += 1
+            metrics.observe(
+                f"{self.name}.wait_seconds", self._clock() - job.queued_at
+            )
+            task = asyncio.ensure_future(self._run(job))
+            # The loop only keeps weak references to running tasks
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job):
+        try:
+            result = await job.func()
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+        except Exception as e:
+            job.future.set_exception(e)
+        else:
+            job.future.set_result(result)
+        finally:
+            self._running -= 1
+            for counts, key in (
+                (self._running_by_guild, job.guild),
+                (self._running_by_user, job.user),
+            ):
+                counts[key] -= 1
+                if counts[key] <= 0:
+                    del counts[key]
+            if (
+                job.guild not in self._running_by_guild
+                and job.guild not in self._queues
+            ):
+                self._last_served.pop(job.guild, None)
+            self._dispatch()
@@ -20,6 +20,61 @@ XWS_DATA_ROOT_DIR = os.getenv(
     "XWS_DATA_ROOT_DIR", "submodules/xwing-data2/data"
 )  # For init_db
 
+# --- RollBetter Client ---
+# One keep-alive session is shared by every list fetch
+RB_CONNECTION_LIMIT = int(os.getenv("RB_CONNECTION_LIMIT", "10"))
+RB_KEEPALIVE_TIMEOUT = float(os.getenv("RB_KEEPALIVE_TIMEOUT", "60"))
+RB_DNS_CACHE_TTL = int(os.getenv("RB_DNS_CACHE_TTL", "300"))
+# Timeout of a single attempt
+RB_REQUEST_TIMEOUT = float(os.getenv("RB_REQUEST_TIMEOUT", "8"))
+# Total time a list fetch may take, retries and backoff included
+RB_DEADLINE = float(os.getenv("RB_DEADLINE", "15"))
+# Retries of timeouts, connection errors, 429 and 5xx answers
+RB_MAX_RETRIES = int(os.getenv("RB_MAX_RETRIES", "2"))
+# Upper bound of the first jittered backoff, doubled on each retry
+RB_RETRY_BASE_DELAY = float(os.getenv("RB_RETRY_BASE_DELAY", "0.5"))
+# Consecutive failures after which fetches fail fast, and for how long
+RB_BREAKER_THRESHOLD = int(os.getenv("RB_BREAKER_THRESHOLD", "5"))
+RB_BREAKER_RESET_TIMEOUT = float(os.getenv("RB_BREAKER_RESET_TIMEOUT", "30"))
+
+# --- XWS Cache ---
+# Fetched lists are cached in memory and in an SQLite file keyed by the
+# canonical YASB link. An empty path keeps the cache in memory only.
+XWS_CACHE_PATH = os.getenv("XWS_CACHE_PATH", "xws_cache.sqlite3")
+XWS_CACHE_MEMORY_ENTRIES = int(os.getenv("XWS_CACHE_MEMORY_ENTRIES", "512"))
+XWS_CACHE_DISK_ENTRIES = int(os.getenv("XWS_CACHE_DISK_ENTRIES", "20000"))
+XWS_CACHE_TTL = float(os.getenv("XWS_CACHE_TTL", "86400"))
+
+# --- Card Storage ---
+# "mongo" serves cards from MongoDB, "embedded" loads XWS_DATA_ROOT_DIR
+# straight into memory without any external service.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo")
+# Binary catalog snapshot restored at startup while it matches the data
+# served by the storage backend (the MongoDB manifest, or XWS_DATA_ROOT_DIR
+# when embedded), rewritten after each load. Empty disables snapshots.
+CATALOG_SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT_PATH", "catalog.snapshot")
+# Seconds between checks of the MongoDB data manifest, reloading the catalog
+# after /reinit_db or /rollback_db. 0 disables the checks.
+CATALOG_REFRESH_INTERVAL = float(os.getenv("CATALOG_REFRESH_INTERVAL", "60"))
+
+# --- MongoDB Access ---
+# Client pool and timeouts; the client itself is created lazily on first use
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "20"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "1"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(
+    os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")
+)
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "10000"))
+
+# --- Data Import ---
+# Threads parsing xwing-data2 files (1 parses inline)
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "1"))
+# Documents per unordered bulk_write batch
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+# Worker threads running blocking pymongo queries off the event loop
+MONGO_EXECUTOR_WORKERS = int(os.getenv("MONGO_EXECUTOR_WORKERS", "8"))
+
 # --- External Asset URLs ---
 GOLDENROD_PILOTS_URL = (
     "https://github.com/SogeMoge/x-wing2.0-project-goldenrod/blob/2.0/"
@@ -30,8 +85,28 @@ GOLDENROD_UPGRADES_URL = (
     "src/images/En/upgrades/"
 )
 
+# --- Logging ---
+# File the bot logs to next to the console, empty logs to the console only
+LOG_FILE = os.getenv("LOG_FILE", "xwsbot.log")
+
 # --- Bot Behaviour ---
 DISCORD_EMBED_DESCRIPTION_LIMIT = 4096
+# Embeds, and characters across them, Discord accepts in one message
+DISCORD_MESSAGE_EMBEDS_LIMIT = 10
+DISCORD_MESSAGE_EMBED_CHARS_LIMIT = 6000
+# YASB links of one message rendered, further ones are skipped with a notice
+MAX_LISTS_PER_MESSAGE = int(os.getenv("MAX_LISTS_PER_MESSAGE", "5"))
+# Channels whose reply ordering lock is kept; idle ones beyond are evicted
+CHANNEL_LOCKS_MAX = int(os.getenv("CHANNEL_LOCKS_MAX", "1024"))
+# Lists loaded at once, in total and per guild/user, and lists allowed to
+# wait in total and per guild before new ones are turned away
+WORKERS = int(os.getenv("WORKERS", "8"))
+WORKERS_PER_GUILD = int(os.getenv("WORKERS_PER_GUILD", "3"))
+WORKERS_PER_USER = int(os.getenv("WORKERS_PER_USER", "2"))
+QUEUE_MAX = int(os.getenv("QUEUE_MAX", "100"))
+QUEUE_MAX_PER_GUILD = int(os.getenv("QUEUE_MAX_PER_GUILD", "20"))
+# Seconds between metrics reports in the log, 0 disables them
+METRICS_LOG_INTERVAL = float(os.getenv("METRICS_LOG_INTERVAL", "300"))
 
 # --- Regex & Mappings ---
 YASB_URL_PATTERN = re.compile(
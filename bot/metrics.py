@@ -0,0 +1,53 @@
+"""Process-wide counters, gauges and timings of the list pipeline.
+
+Counters are incremented where events happen. Gauges are callables read
+when a snapshot is taken, so sizes and states are never stale. Timings
+keep the count, total and maximum of the values observed. The bot logs
+format_snapshot() periodically and on the /metrics command.
+"""
+
+from collections import Counter
+
+counters = Counter()
+_gauges = {}
+_timings = {}
+
+
+def increment(name, amount=1):
+    """Adds amount to the counter called name."""
+    counters[name] += amount
+
+
+def register_gauge(name, func):
+    """Registers a callable returning the current value of a gauge."""
+    _gauges[name] = func
+
+
+def observe(name, value):
+    """Records one value, e.g. a duration in seconds, of a timing."""
+    timing = _timings.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+    timing["count"] += 1
+    timing["total"] += value
+    timing["max"] = max(timing["max"], value)
+
+
+def snapshot():
+    """Returns every counter, gauge and timing as one flat dict."""
+    result = dict(counters)
+    result.update({name: func() for name, func in _gauges.items()})
+    for name, timing in _timings.items():
+        for field, value in timing.items():
+            result[f"{name}.{field}"] = value
+    return result
+
+
+def format_snapshot(separator=", "):
+    """Returns the snapshot as "name=value" entries, sorted by name."""
+    return separator.join(
+        (
+            f"{name}={value:.3f}"
+            if isinstance(value, float)
+            else f"{name}={value}"
+        )
+        for name, value in sorted(snapshot().items())
+    )
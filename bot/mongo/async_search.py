@@ -0,0 +1,91 @@
+"""Awaitable versions of the bot.mongo.search lookups.
+
+pymongo is synchronous, so database queries run in a dedicated thread pool
+and never block the discord gateway loop. Lookups answered by the
+in-memory catalog or the embedded backend stay on the loop since they do
+no I/O.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from bot import config
+from bot.mongo import search
+
+_executor = ThreadPoolExecutor(
+    max_workers=config.MONGO_EXECUTOR_WORKERS, thread_name_prefix="mongo"
+)
+
+
+async def _run(func, *args):
+    """Runs a blocking search function without stalling the event loop."""
+    if search.get_backend().in_memory:
+        return func(*args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _executor, functools.partial(func, *args)
+    )
+
+
+async def warm_up_db_connection():
+    """Awaitable search.warm_up_db_connection, always run in the pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, search.warm_up_db_connection)
+
+
+async def refresh_catalog():
+    """Awaitable search.refresh_catalog, always run in the pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, search.refresh_catalog)
+
+
+def close_db_connection():
+    """Stops the query thread pool and closes the MongoDB client."""
+    _executor.shutdown(wait=False, cancel_futures=True)
+    search.close_db_connection()
+
+
+async def find_pilot(xws: str):
+    """Awaitable search.find_pilot."""
+    return await _run(search.find_pilot, xws)
+
+
+async def find_upgrade(xws: str):
+    """Awaitable search.find_upgrade."""
+    return await _run(search.find_upgrade, xws)
+
+
+async def find_ship_by_pilot(xws: str):
+    """Awaitable search.find_ship_by_pilot."""
+    return await _run(search.find_ship_by_pilot, xws)
+
+
+async def find_faction(xws: str):
+    """Awaitable search.find_faction."""
+    return await _run(search.find_faction, xws)
+
+
+async def find_pilots_many(ids):
+    """Awaitable search.find_pilots_many."""
+    return await _run(search.find_pilots_many, list(ids))
+
+
+async def find_upgrades_many(ids):
+    """Awaitable search.find_upgrades_many."""
+    return await _run(search.find_upgrades_many, list(ids))
+
+
+async def find_ships_by_pilots_many(ids):
+    """Awaitable search.find_ships_by_pilots_many."""
+    return await _run(search.find_ships_by_pilots_many, list(ids))
+
+
+async def find_pilot_with_ship(xws: str):
+    """Awaitable search.find_pilot_with_ship."""
+    return await _run(search.find_pilot_with_ship, xws)
+
+
+async def find_pilots_with_ships_many(ids):
+    """Awaitable search.find_pilots_with_ships_many."""
+    return await _run(search.find_pilots_with_ships_many, list(ids))
@@ -0,0 +1,385 @@
+"""Storage backends answering the bot.mongo.search lookups.
+
+Pilots, ships and upgrades are returned as bot.mongo.models records,
+factions as documents. Single lookups return one of them or None. Batched
+lookups take a list of unique, non-empty xws ids and return a dict keyed by
+xws, leaving unknown ids out. Logging of missing cards is left to
+bot.mongo.search.
+"""
+
+import logging
+import os
+from abc import ABC, abstractmethod
+
+from bot.mongo.client import get_client, get_collection, warm_up_db_connection
+from bot.mongo.init_db import (
+    MANIFEST_COLLECTION,
+    MANIFEST_ID,
+    PILOT_CARDS_COLLECTION,
+    data_version,
+    read_documents,
+)
+from bot.mongo.models import (
+    SHIP_PROJECTION,
+    UPGRADE_PROJECTION,
+    PilotRecord,
+    ShipRecord,
+    UpgradeRecord,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class StorageBackend(ABC):
+    """Interface every card storage backend implements.
+
+    Subclasses must implement load and every lookup, an incomplete backend
+    cannot be instantiated.
+    """
+
+    # True when lookups are answered from memory without any I/O
+    in_memory = False
+
+    @abstractmethod
+    def load(self):
+        """Fills the in-memory catalog, returns True on success."""
+
+    def warm_up(self):
+        """Prepares connections ahead of the first lookup."""
+        return True
+
+    def data_version(self):
+        """Identifies the data currently served, None if unknown."""
+        return None
+
+    @abstractmethod
+    def find_pilot(self, xws):
+        """Returns the PilotRecord of a pilot, or None."""
+
+    @abstractmethod
+    def find_pilot_document(self, xws):
+        """Returns the full xwing-data2 document of a pilot, or None."""
+
+    @abstractmethod
+    def find_upgrade(self, xws):
+        """Returns the UpgradeRecord of an upgrade, or None."""
+
+    @abstractmethod
+    def find_ship_by_pilot(self, xws):
+        """Returns the ShipRecord of a pilot's ship, or None."""
+
+    @abstractmethod
+    def find_faction(self, xws):
+        """Returns the document of a faction, or None."""
+
+    @abstractmethod
+    def find_pilots_many(self, ids):
+        """Returns PilotRecords keyed by pilot xws."""
+
+    @abstractmethod
+    def find_upgrades_many(self, ids):
+        """Returns UpgradeRecords keyed by upgrade xws."""
+
+    @abstractmethod
+    def find_ships_by_pilots_many(self, ids):
+        """Returns ShipRecords keyed by pilot xws."""
+
+    @abstractmethod
+    def find_pilots_with_ships_many(self, ids):
+        """Returns PilotRecords with their `ship` set, keyed by pilot xws."""
+
+
+class CatalogBackend(StorageBackend):
+    """Serves lookups from an in-memory Catalog."""
+
+    in_memory = True
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def load(self):
+        return self.catalog.loaded
+
+    def find_pilot(self, xws):
+        return self.catalog.pilots.get(xws)
+
+    def find_pilot_document(self, xws):
+        # Records only keep the fields the bot renders
+        return None
+
+    def find_upgrade(self, xws):
+        return self.catalog.upgrades.get(xws)
+
+    def find_ship_by_pilot(self, xws):
+        pilot = self.catalog.pilots.get(xws)
+        return pilot.ship if pilot else None
+
+    def find_faction(self, xws):
+        return self.catalog.factions.get(xws)
+
+    def find_pilots_many(self, ids):
+        pilots = self.catalog.pilots
+        return {xws: pilots[xws] for xws in ids if xws in pilots}
+
+    def find_upgrades_many(self, ids):
+        upgrades = self.catalog.upgrades
+        return {xws: upgrades[xws] for xws in ids if xws in upgrades}
+
+    def find_ships_by_pilots_many(self, ids):
+        pilots = self.catalog.pilots
+        return {
+            xws: pilots[xws].ship
+            for xws in ids
+            if xws in pilots and pilots[xws].ship
+        }
+
+    # Catalog pilots always carry their ship
+    find_pilots_with_ships_many = find_pilots_many
+
+
+class EmbeddedBackend(CatalogBackend):
+    """Loads the xwing-data2 JSON files straight into memory.
+
+    Needs no external service; meant for small deployments and
+    benchmarking.
+    """
+
+    def __init__(self, catalog, data_root_dir):
+        super().__init__(catalog)
+        self.data_root_dir = data_root_dir
+        # Full pilot documents by xws, for find_pilot_document
+        self._pilot_documents = None
+
+    def data_version(self):
+        """Returns init_db.data_version of the data directory, if any."""
+        if not os.path.isdir(self.data_root_dir):
+            return None
+        return data_version(self.data_root_dir)
+
+    def _index_pilot_documents(self, ship_docs):
+        self._pilot_documents = {
+            pilot_doc["xws"]: pilot_doc
+            for ship_doc in ship_docs
+            for pilot_doc in ship_doc.get("pilots") or []
+            if pilot_doc.get("xws")
+        }
+
+    def find_pilot_document(self, xws):
+        if self._pilot_documents is None:
+            # The catalog was restored from a snapshot, load() never ran
+            self._index_pilot_documents(
+                read_documents("pilots", self.data_root_dir)
+            )
+        return self._pilot_documents.get(xws)
+
+    def load(self):
+        if not os.path.isdir(self.data_root_dir):
+            logger.error(f"XWS data directory not found: {self.data_root_dir}")
+            return False
+        try:
+            # Pilot files are parsed once, for the catalog and the index
+            ship_docs = list(read_documents("pilots", self.data_root_dir))
+            self.catalog.load(
+                ship_docs,
+                read_documents("upgrades", self.data_root_dir),
+                read_documents("factions", self.data_root_dir),
+            )
+            self._index_pilot_documents(ship_docs)
+            return True
+        except Exception as e:
+            logger.error(
+                f"Error loading card catalog from {self.data_root_dir}: {e}",
+                exc_info=True,
+            )
+            return False
+
+
+class MongoBackend(StorageBackend):
+    """Queries the 'xwing-data2' MongoDB database."""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def load(self):
+        client = get_client()
+        if client is None:
+            logger.error("MongoDB not available, card catalog not loaded.")
+            return False
+        try:
+            self.catalog.load_from_db(client["xwing-data2"])
+            return True
+        except Exception as e:
+            logger.error(f"Error loading card catalog: {e}", exc_info=True)
+            return False
+
+    def warm_up(self):
+        return warm_up_db_connection()
+
+    def data_version(self):
+        """Returns the manifest of the live generation, None if unknown.
+
+        Reloads and rollbacks swap the manifest in with the collections,
+        so it changes whenever the served data does.
+        """
+        manifest_collection = get_collection(MANIFEST_COLLECTION)
+        if manifest_collection is None:
+            return None
+        try:
+            return manifest_collection.find_one(
+                {"_id": MANIFEST_ID},
+                {"_id": 0, "release": 1, "tree_hash": 1},
+            )
+        except Exception as e:
+            logger.error(f"Error reading data manifest: {e}", exc_info=True)
+            return None
+
+    def find_pilot(self, xws):
+        pilots_collection = get_collection("pilots")
+        if pilots_collection is None:
+            logger.error("MongoDB pilots_collection not available.")
+            return None
+        try:
+            doc = pilots_collection.find_one(
+                {"pilots.xws": xws}, {"pilots.$": 1, "_id": 0}
+            )
+            if doc and "pilots" in doc and doc["pilots"]:
+                return PilotRecord.from_doc(doc["pilots"][0])
+            return None
+        except Exception as e:
+            logger.error(f"Error querying pilot '{xws}': {e}", exc_info=True)
+            return None
+
+    def find_pilot_document(self, xws):
+        pilots_collection = get_collection("pilots")
+        if pilots_collection is None:
+            logger.error("MongoDB pilots_collection not available.")
+            return None
+        try:
+            doc = pilots_collection.find_one(
+                {"pilots.xws": xws}, {"pilots.$": 1, "_id": 0}
+            )
+        except Exception as e:
+            logger.error(f"Error querying pilot '{xws}': {e}", exc_info=True)
+            return None
+        if doc and doc.get("pilots"):
+            return doc["pilots"][0]
+        return None
+
+    def find_upgrade(self, xws):
+        upgrades_collection = get_collection("upgrades")
+        if upgrades_collection is None:
+            logger.error("MongoDB upgrades_collection not available.")
+            return None
+        try:
+            doc = upgrades_collection.find_one(
+                {"xws": xws}, UPGRADE_PROJECTION
+            )
+            return UpgradeRecord.from_doc(doc) if doc else None
+        except Exception as e:
+            logger.error(f"Error querying upgrade '{xws}': {e}", exc_info=True)
+            return None
+
+    def find_ship_by_pilot(self, xws):
+        pilots_collection = get_collection("pilots")
+        if pilots_collection is None:
+            logger.error("MongoDB pilots_collection not available.")
+            return None
+        try:
+            doc = pilots_collection.find_one(
+                {"pilots.xws": xws}, SHIP_PROJECTION
+            )
+            return ShipRecord.from_doc(doc) if doc else None
+        except Exception as e:
+            logger.error(
+                f"Error querying ship for pilot '{xws}': {e}", exc_info=True
+            )
+            return None
+
+    def find_faction(self, xws):
+        factions_collection = get_collection("factions")
+        if factions_collection is None:
+            logger.error("MongoDB factions_collection not available.")
+            return None
+        try:
+            return factions_collection.find_one({"xws": xws}, {"_id": 0})
+        except Exception as e:
+            logger.error(f"Error querying faction '{xws}': {e}", exc_info=True)
+            return None
+
+    def find_pilots_many(self, ids):
+        pilots_collection = get_collection("pilots")
+        if pilots_collection is None:
+            logger.error("MongoDB pilots_collection not available.")
+            return {}
+        pipeline = [
+            {"$match": {"pilots.xws": {"$in": ids}}},
+            {"$unwind": "$pilots"},
+            {"$match": {"pilots.xws": {"$in": ids}}},
+            {"$replaceRoot": {"newRoot": "$pilots"}},
+        ]
+        try:
+            return {
+                pilot["xws"]: PilotRecord.from_doc(pilot)
+                for pilot in pilots_collection.aggregate(pipeline)
+            }
+        except Exception as e:
+            logger.error(f"Error querying pilots {ids}: {e}", exc_info=True)
+            return {}
+
+    def find_upgrades_many(self, ids):
+        upgrades_collection = get_collection("upgrades")
+        if upgrades_collection is None:
+            logger.error("MongoDB upgrades_collection not available.")
+            return {}
+        try:
+            return {
+                upgrade["xws"]: UpgradeRecord.from_doc(upgrade)
+                for upgrade in upgrades_collection.find(
+                    {"xws": {"$in": ids}}, UPGRADE_PROJECTION
+                )
+            }
+        except Exception as e:
+            logger.error(f"Error querying upgrades {ids}: {e}", exc_info=True)
+            return {}
+
+    def find_ships_by_pilots_many(self, ids):
+        pilots_collection = get_collection("pilots")
+        if pilots_collection is None:
+            logger.error("MongoDB pilots_collection not available.")
+            return {}
+        wanted = set(ids)
+        found = {}
+        try:
+            for ship_doc in pilots_collection.find(
+                {"pilots.xws": {"$in": ids}}, SHIP_PROJECTION
+            ):
+                ship = ShipRecord.from_doc(ship_doc)
+                for pilot in ship_doc.get("pilots") or []:
+                    if pilot.get("xws") in wanted:
+                        found[pilot["xws"]] = ship
+        except Exception as e:
+            logger.error(
+                f"Error querying ships for pilots {ids}: {e}", exc_info=True
+            )
+            return {}
+        return found
+
+    def find_pilots_with_ships_many(self, ids):
+        pilot_cards_collection = get_collection(PILOT_CARDS_COLLECTION)
+        if pilot_cards_collection is None:
+            logger.error("MongoDB pilot_cards_collection not available.")
+            return {}
+        try:
+            return {
+                card["_id"]: PilotRecord.from_doc(
+                    card["pilot"], ShipRecord.from_doc(card["ship"])
+                )
+                for card in pilot_cards_collection.find(
+                    {"_id": {"$in": ids}}, {"_id": 1, "pilot": 1, "ship": 1}
+                )
+            }
+        except Exception as e:
+            logger.error(
+                f"Error querying pilot cards {ids}: {e}", exc_info=True
+            )
+            return {}
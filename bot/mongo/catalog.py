@@ -0,0 +1,123 @@
+"""In-memory card catalog built from the xwing-data2 collections."""
+
+import logging
+
+from bot.mongo.init_db import read_documents
+from bot.mongo.models import (  # noqa: F401 (re-exported)
+    SHIP_PROJECTION,
+    UPGRADE_PROJECTION,
+    CostTable,
+    PilotRecord,
+    ShipRecord,
+    UpgradeRecord,
+    build_cost_table,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Catalog:
+    """Read-only view of pilots, upgrades and factions keyed by xws.
+
+    The catalog is filled once from the database or the xwing-data2 files
+    (at startup and after a reload) so that list enrichment is served from
+    dicts instead of per-item MongoDB round trips. Pilots and upgrades are
+    kept as compact records, see bot.mongo.models.
+    """
+
+    def __init__(self):
+        self.pilots = {}
+        self.upgrades = {}
+        self.factions = {}
+        self.loaded = False
+
+    def load(self, ship_docs, upgrade_docs, faction_docs):
+        """Builds the xws indexes from raw collection documents.
+
+        Args:
+            ship_docs (iterable): Documents of the 'pilots' collection,
+                one per ship with a nested 'pilots' array.
+            upgrade_docs (iterable): Documents of the 'upgrades' collection.
+            faction_docs (iterable): Documents of the 'factions' collection.
+        """
+        pilots = {}
+        for ship_doc in ship_docs:
+            ship = ShipRecord.from_doc(ship_doc)
+            for pilot_doc in ship_doc.get("pilots") or []:
+                if pilot_doc.get("xws"):
+                    pilot = PilotRecord.from_doc(pilot_doc, ship)
+                    pilots[pilot.xws] = pilot
+
+        upgrades = {}
+        for upgrade_doc in upgrade_docs:
+            if upgrade_doc.get("xws"):
+                upgrade = UpgradeRecord.from_doc(upgrade_doc)
+                upgrades[upgrade.xws] = upgrade
+
+        factions = {}
+        for faction in faction_docs:
+            faction.pop("_id", None)
+            if faction.get("xws"):
+                factions[faction["xws"]] = faction
+
+        self.restore(pilots, upgrades, factions)
+
+    def restore(self, pilots, upgrades, factions):
+        """Installs prebuilt indexes, e.g. those of a catalog snapshot."""
+        # Swap the new indexes in together so lookups never see a mix of
+        # the previous and the current data.
+        self.pilots, self.upgrades, self.factions = pilots, upgrades, factions
+        self.loaded = True
+        logger.info(
+            f"Catalog loaded: {len(pilots)} pilots, {len(upgrades)} "
+            f"upgrades, {len(factions)} factions."
+        )
+
+    def price_many(self, pairs):
+        """Prices many (upgrade, pilot) combinations at once.
+
+        Args:
+            pairs (iterable[tuple]): (upgrade_xws, size, agility, initiative)
+                tuples, e.g. every upgrade of every pilot of a format.
+
+        Returns:
+            list[int | None]: Costs in input order, None when unpriceable.
+        """
+        upgrades = self.upgrades
+        return [
+            (
+                upgrade.cost.lookup(size, agility, initiative)
+                if (upgrade := upgrades.get(upgrade_xws)) is not None
+                and upgrade.cost is not None
+                else None
+            )
+            for upgrade_xws, size, agility, initiative in pairs
+        ]
+
+    def load_from_db(self, xws_db):
+        """Loads the catalog from the 'xwing-data2' database.
+
+        Args:
+            xws_db (pymongo.database.Database): The 'xwing-data2' database.
+        """
+        self.load(
+            xws_db["pilots"].find({}, SHIP_PROJECTION),
+            xws_db["upgrades"].find({}, UPGRADE_PROJECTION),
+            xws_db["factions"].find({}, {"_id": 0}),
+        )
+
+    def load_from_data_dir(self, data_root_dir):
+        """Loads the catalog straight from the xwing-data2 JSON files.
+
+        Args:
+            data_root_dir (str): The root directory of the xwing-data2
+                dataset, e.g. config.XWS_DATA_ROOT_DIR.
+        """
+        self.load(
+            read_documents("pilots", data_root_dir),
+            read_documents("upgrades", data_root_dir),
+            read_documents("factions", data_root_dir),
+        )
+
+
+catalog = Catalog()
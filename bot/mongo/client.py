@@ -0,0 +1,85 @@
+"""Lazily created, shared MongoClient for the bot.
+
+The client is created on first use rather than at import time, so that
+importing the bot never waits on server selection.
+"""
+
+import logging
+import threading
+
+from pymongo import MongoClient
+from pymongo.server_api import ServerApi
+
+from bot import config
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Returns the shared MongoClient, creating it on first use.
+
+    Returns:
+        MongoClient | None: None if the client cannot be configured.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                try:
+                    _client = MongoClient(
+                        config.MONGODB_URI,
+                        server_api=ServerApi("1"),
+                        maxPoolSize=config.MONGO_MAX_POOL_SIZE,
+                        minPoolSize=config.MONGO_MIN_POOL_SIZE,
+                        serverSelectionTimeoutMS=(
+                            config.MONGO_SERVER_SELECTION_TIMEOUT_MS
+                        ),
+                        connectTimeoutMS=config.MONGO_CONNECT_TIMEOUT_MS,
+                        socketTimeoutMS=config.MONGO_SOCKET_TIMEOUT_MS,
+                    )
+                except Exception as e:
+                    logger.critical(
+                        f"FATAL: Failed to create MongoDB client: {e}",
+                        exc_info=True,
+                    )
+    return _client
+
+
+def get_collection(name):
+    """Returns a collection of the 'xwing-data2' database, or None."""
+    client = get_client()
+    if client is None:
+        return None
+    return client["xwing-data2"][name]
+
+
+def warm_up_db_connection():
+    """Opens the connection pool ahead of the first lookup.
+
+    Meant to be called once the bot is up (e.g. in on_ready), so the first
+    list does not pay for server selection and the initial handshake.
+    Returns True if MongoDB answered the ping.
+    """
+    client = get_client()
+    if client is None:
+        return False
+    try:
+        client.admin.command("ping")
+        logger.info("Successfully connected to MongoDB.")
+        return True
+    except Exception as e:
+        logger.error(f"MongoDB warm-up ping failed: {e}", exc_info=True)
+        return False
+
+
+def close_db_connection():
+    """Closes the shared MongoClient, if it was ever created."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+            logger.info("MongoDB connection closed.")
@@ -0,0 +1,244 @@
+"""Compact card records served by the bot.mongo.search lookups.
+
+The source documents carry ability text, alt art and other fields the bot
+never shows. Records keep only what the list renderer and the cost logic
+read, in __slots__ attributes, with xws ids and ship sizes interned so
+repeated values share one string.
+"""
+
+import sys
+
+COST_VARIABLES = ("size", "agility", "initiative")
+
+# MongoDB projections fetching only the fields the records are built from
+SHIP_PROJECTION = {
+    "_id": 0,
+    "xws": 1,
+    "name": 1,
+    "size": 1,
+    "stats": 1,
+    "pilots.xws": 1,
+    "pilots.name": 1,
+    "pilots.initiative": 1,
+    "pilots.cost": 1,
+    "pilots.image": 1,
+}
+UPGRADE_PROJECTION = {
+    "_id": 0,
+    "xws": 1,
+    "name": 1,
+    "cost": 1,
+    "sides.image": 1,
+}
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _stat_value(stats, stat_type):
+    """Returns the value of one stat of a ship's stats list."""
+    if not isinstance(stats, list):
+        return None
+    for stat in stats:
+        if isinstance(stat, dict) and stat.get("type") == stat_type:
+            return stat.get("value")
+    return None
+
+
+class CostTable:
+    """Normalized cost of an upgrade.
+
+    Fixed costs keep their value in `fixed`. Variable costs keep the stat
+    they depend on in `variable` and the prices in `values`, keyed by the
+    ship size name or by the int agility/initiative.
+    """
+
+    __slots__ = ("fixed", "variable", "values")
+
+    def __init__(self, fixed=None, variable=None, values=None):
+        self.fixed = fixed
+        self.variable = variable
+        self.values = values or {}
+
+    def lookup(self, size=None, agility=None, initiative=None):
+        """Returns the cost for a ship size, agility and pilot initiative."""
+        if self.variable is None:
+            return self.fixed
+        if self.variable == "size":
+            return self.values.get(size)
+        if self.variable == "agility":
+            return self.values.get(_to_int(agility))
+        return self.values.get(_to_int(initiative))
+
+    def to_dict(self):
+        """Returns the table in the shape of an xwing-data2 cost object."""
+        if self.variable is None:
+            return {"value": self.fixed}
+        return {"variable": self.variable, "values": dict(self.values)}
+
+    def __eq__(self, other):
+        if not isinstance(other, CostTable):
+            return NotImplemented
+        return (self.fixed, self.variable, self.values) == (
+            other.fixed,
+            other.variable,
+            other.values,
+        )
+
+
+def build_cost_table(cost_obj):
+    """Parses an upgrade `cost` object into a CostTable.
+
+    Args:
+        cost_obj (dict): Either {"value": n} or
+            {"variable": "size|agility|initiative", "values": {...}}.
+
+    Returns:
+        CostTable | None: None if the cost object cannot be priced.
+    """
+    if not isinstance(cost_obj, dict):
+        return None
+    if "value" in cost_obj:
+        fixed = _to_int(cost_obj["value"])
+        return CostTable(fixed=fixed) if fixed is not None else None
+    variable = cost_obj.get("variable")
+    values_dict = cost_obj.get("values")
+    if variable not in COST_VARIABLES or not isinstance(values_dict, dict):
+        return None
+    values = {}
+    for key, raw_cost in values_dict.items():
+        if variable != "size":
+            key = _to_int(key)
+        else:
+            key = _intern(key)
+        cost = _to_int(raw_cost)
+        if key is not None and cost is not None:
+            values[key] = cost
+    return CostTable(variable=variable, values=values)
+
+
+class Record:
+    """Base of the card records: equality, repr and dict export."""
+
+    __slots__ = ()
+
+    def to_dict(self):
+        """Returns the record as a plain, JSON serializable dict."""
+        result = {}
+        for field in self.__slots__:
+            value = getattr(self, field)
+            if isinstance(value, (Record, CostTable)):
+                value = value.to_dict()
+            result[field] = value
+        return result
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(
+            getattr(self, field) == getattr(other, field)
+            for field in self.__slots__
+        )
+
+    def __repr__(self):
+        fields = ", ".join(
+            f"{field}={getattr(self, field)!r}" for field in self.__slots__
+        )
+        return f"{type(self).__name__}({fields})"
+
+
+class ShipRecord(Record):
+    """Ship fields shown next to a pilot and used to price upgrades."""
+
+    __slots__ = ("xws", "name", "size", "agility")
+
+    def __init__(self, xws, name=None, size=None, agility=None):
+        self.xws = xws
+        self.name = name
+        self.size = size
+        self.agility = agility
+
+    @classmethod
+    def from_doc(cls, doc):
+        """Builds the record from a ship document or pilot card summary."""
+        return cls(
+            xws=_intern(doc.get("xws")),
+            name=doc.get("name"),
+            size=_intern(doc.get("size")),
+            agility=_to_int(_stat_value(doc.get("stats"), "agility")),
+        )
+
+
+class PilotRecord(Record):
+    """Pilot fields of a rendered list line, linked to the pilot's ship."""
+
+    __slots__ = ("xws", "name", "initiative", "cost", "image", "ship")
+
+    def __init__(
+        self,
+        xws,
+        name=None,
+        initiative=None,
+        cost=None,
+        image=None,
+        ship=None,
+    ):
+        self.xws = xws
+        self.name = name
+        self.initiative = initiative
+        self.cost = cost
+        self.image = image
+        self.ship = ship
+
+    @classmethod
+    def from_doc(cls, doc, ship=None):
+        """Builds the record from a pilot subdocument.
+
+        Args:
+            doc (dict): Pilot from the nested 'pilots' array of a ship.
+            ship (ShipRecord | None): The pilot's ship.
+        """
+        return cls(
+            xws=_intern(doc.get("xws")),
+            name=doc.get("name"),
+            initiative=doc.get("initiative"),
+            cost=_to_int(doc.get("cost")),
+            image=doc.get("image"),
+            ship=ship,
+        )
+
+
+class UpgradeRecord(Record):
+    """Upgrade fields of a rendered list line with its parsed cost."""
+
+    __slots__ = ("xws", "name", "image", "cost")
+
+    def __init__(self, xws, name=None, image=None, cost=None):
+        self.xws = xws
+        self.name = name
+        self.image = image
+        self.cost = cost
+
+    @classmethod
+    def from_doc(cls, doc):
+        """Builds the record from an upgrade document.
+
+        The image is the one of the upgrade's first side, the cost object
+        is parsed into a CostTable.
+        """
+        sides = doc.get("sides")
+        front = sides[0] if isinstance(sides, list) and sides else None
+        return cls(
+            xws=_intern(doc.get("xws")),
+            name=doc.get("name"),
+            image=front.get("image") if isinstance(front, dict) else None,
+            cost=build_cost_table(doc.get("cost")),
+        )
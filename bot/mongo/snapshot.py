@@ -0,0 +1,149 @@
+"""Binary snapshots of the in-memory card catalog.
+
+A snapshot holds the catalog indexes exactly as Catalog.load builds them,
+so a restart can serve lookups without loading the MongoDB collections or
+parsing the xwing-data2 JSON files. A snapshot is only used while its tree
+hash matches the data version of the storage backend. The file starts
+with SNAPSHOT_MAGIC and a one line JSON header (format, schema version,
+data release and tree hash) followed by a pickle of the indexes.
+Snapshots are trusted build artifacts: only load files this module wrote.
+
+Usage:
+    python -m bot.mongo.snapshot [output_path]
+"""
+
+import json
+import logging
+import os
+import pickle
+import sys
+import tempfile
+
+from bot import config
+from bot.mongo.catalog import Catalog
+from bot.mongo.init_db import SCHEMA_VERSION, data_version
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"XWSCATALOG\n"
+# Bump when the pickled payload changes shape
+SNAPSHOT_FORMAT = 4
+
+
+def current_data_version(data_root_dir):
+    """Returns init_db.data_version, None without a data directory."""
+    if not os.path.isdir(data_root_dir):
+        return None
+    return data_version(data_root_dir)
+
+
+def write_snapshot(catalog, path, version=None):
+    """Writes a loaded catalog to a snapshot file.
+
+    The file is written next to its destination and moved into place, so
+    a concurrent reader never sees a partial snapshot.
+
+    Args:
+        catalog (Catalog): A loaded catalog.
+        path (str): Destination of the snapshot.
+        version (dict | None): Data version of the data the catalog was
+            loaded from, see StorageBackend.data_version.
+    """
+    header = {
+        "format": SNAPSHOT_FORMAT,
+        "schema_version": SCHEMA_VERSION,
+        "release": (version or {}).get("release"),
+        "tree_hash": (version or {}).get("tree_hash"),
+    }
+    payload = (catalog.pilots, catalog.upgrades, catalog.factions)
+    # A unique temporary name, concurrent writers never share a file
+    file = tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(path) or ".",
+        prefix=f".{os.path.basename(path)}.",
+        suffix=".tmp",
+        delete=False,
+    )
+    try:
+        with file:
+            file.write(SNAPSHOT_MAGIC)
+            file.write(json.dumps(header).encode("utf8") + b"\n")
+            pickle.dump(payload, file, protocol=pickle.HIGHEST_PROTOCOL)
+        # NamedTemporaryFile creates the file readable by its owner only
+        os.chmod(file.name, 0o644)
+        os.replace(file.name, path)
+    except BaseException:
+        os.unlink(file.name)
+        raise
+    logger.info(f"Catalog snapshot written to {path}.")
+
+
+def read_snapshot_header(file):
+    """Reads the header of an open snapshot, None if it is not one."""
+    if file.readline() != SNAPSHOT_MAGIC:
+        return None
+    try:
+        return json.loads(file.readline())
+    except ValueError:
+        return None
+
+
+def load_snapshot(catalog, path, version=None):
+    """Fills a catalog from a snapshot file if it is still current.
+
+    Args:
+        catalog (Catalog): The catalog to restore into.
+        path (str): Location of the snapshot.
+        version (dict | None): Data version of the storage backend, see
+            StorageBackend.data_version. The snapshot must have been built
+            from data with the same tree hash.
+
+    Returns:
+        bool: True if the catalog was restored, False if the snapshot is
+            missing, unreadable or stale, or if no version is known to
+            check it against.
+    """
+    if not os.path.isfile(path):
+        return False
+    if not version or not version.get("tree_hash"):
+        logger.info(f"Data version unknown, catalog snapshot {path} unused.")
+        return False
+    try:
+        with open(path, "rb") as file:
+            header = read_snapshot_header(file)
+            if header is None:
+                logger.warning(f"{path} is not a catalog snapshot.")
+                return False
+            if (
+                header.get("format") != SNAPSHOT_FORMAT
+                or header.get("schema_version") != SCHEMA_VERSION
+            ):
+                logger.info(f"Catalog snapshot {path} has an old format.")
+                return False
+            if header.get("tree_hash") != version["tree_hash"]:
+                logger.info(f"Catalog snapshot {path} is out of date.")
+                return False
+            catalog.restore(*pickle.load(file))
+    except Exception as e:
+        logger.error(
+            f"Error loading catalog snapshot {path}: {e}", exc_info=True
+        )
+        return False
+    logger.info(f"Catalog restored from snapshot {path}.")
+    return True
+
+
+if __name__ == "__main__":
+    output_path = (sys.argv[1:] or [config.CATALOG_SNAPSHOT_PATH])[0]
+    if not output_path:
+        sys.exit("No snapshot path given and CATALOG_SNAPSHOT_PATH is empty.")
+    if not os.path.isdir(config.XWS_DATA_ROOT_DIR):
+        sys.exit(f"XWS data directory not found: {config.XWS_DATA_ROOT_DIR}")
+    built = Catalog()
+    built.load_from_data_dir(config.XWS_DATA_ROOT_DIR)
+    write_snapshot(
+        built, output_path, current_data_version(config.XWS_DATA_ROOT_DIR)
+    )
+    print(
+        f"Wrote {output_path}: {len(built.pilots)} pilots, "
+        f"{len(built.upgrades)} upgrades, {len(built.factions)} factions."
+    )
@@ -0,0 +1,147 @@
+"""Client for the RollBetter endpoint converting YASB links to XWS.
+
+All requests go through one long-lived aiohttp session whose connector
+keeps connections to RollBetter alive and caches its DNS lookups, so a
+list fetch costs a single request round trip instead of a fresh DNS
+lookup, TCP connect and TLS handshake.
+
+A list fetch has a total deadline (RB_DEADLINE). Within that deadline,
+timeouts, connection errors and overload answers are retried with
+jittered exponential backoff. A circuit breaker makes fetches fail fast
+with CircuitOpenError while RollBetter keeps failing, so an outage does
+not hold every channel for the whole deadline.
+"""
+
+import asyncio
+import json
+import logging
+import random
+
+import aiohttp
+from yarl import URL
+
+from bot import config, metrics
+from bot.concurrency import CircuitBreaker, CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+# Answers worth retrying, anything else below 500 is final
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+_session = None
+
+breaker = CircuitBreaker(
+    "rollbetter.breaker",
+    failure_threshold=config.RB_BREAKER_THRESHOLD,
+    reset_timeout=config.RB_BREAKER_RESET_TIMEOUT,
+)
+metrics.register_gauge("rollbetter.breaker.state", lambda: breaker.state)
+metrics.register_gauge(
+    "rollbetter.breaker.consecutive_failures", lambda: breaker.failures
+)
+
+
+def get_session():
+    """Returns the shared RollBetter session, creating it on first use.
+
+    Must be called from a coroutine running on the bot's event loop.
+    """
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=config.RB_CONNECTION_LIMIT,
+            keepalive_timeout=config.RB_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=config.RB_DNS_CACHE_TTL,
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=config.RB_REQUEST_TIMEOUT),
+        )
+    return _session
+
+
+async def warm_up():
+    """Opens a pooled connection to RollBetter ahead of the first list.
+
+    Returns True if RollBetter answered, whatever the status code.
+    """
+    origin = URL(config.RB_ENDPOINT).origin()
+    try:
+        async with get_session().head(origin) as response:
+            logger.info(f"RollBetter warm-up: HTTP {response.status}")
+            return True
+    except Exception as e:
+        logger.warning(f"RollBetter warm-up failed: {e}")
+        return False
+
+
+def _is_retryable(error):
+    """Tells whether a failed GET may succeed when sent again."""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status in RETRY_STATUSES
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+async def _get_xws(url):
+    async with get_session().get(url) as response:
+        response.raise_for_status()
+        return json.loads(await response.text())
+
+
+async def fetch_xws(yasb_url):
+    """Converts a YASB list URL to its XWS dict through RollBetter.
+
+    Args:
+        yasb_url (str): The YASB link found in a message.
+
+    Returns:
+        dict: The decoded XWS list.
+
+    Raises:
+        CircuitOpenError: If RollBetter is failing and is not called.
+        aiohttp.ClientResponseError: If RollBetter answers with an error.
+        asyncio.TimeoutError: If the request exceeds the deadline.
+        aiohttp.ClientError: On other connection errors.
+        json.JSONDecodeError: If the response is not JSON.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + config.RB_DEADLINE
+    url = config.RB_ENDPOINT + yasb_url
+    for attempt in range(config.RB_MAX_RETRIES + 1):
+        breaker.before_call()
+        try:
+            xws = await asyncio.wait_for(_get_xws(url), deadline - loop.time())
+        except Exception as e:
+            if isinstance(e, aiohttp.ClientResponseError) and not (
+                _is_retryable(e)
+            ):
+                # RollBetter is up, it rejected this particular list
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            metrics.increment("rollbetter.failures")
+            delay = random.uniform(0, config.RB_RETRY_BASE_DELAY * 2**attempt)
+            if (
+                not _is_retryable(e)
+                or breaker.state == breaker.OPEN
+                or attempt == config.RB_MAX_RETRIES
+                or loop.time() + delay >= deadline
+            ):
+                raise
+            logger.warning(
+                f"RollBetter attempt {attempt + 1} failed ({e!r}), "
+                f"retrying in {delay:.2f}s"
+            )
+            metrics.increment("rollbetter.retries")
+            await asyncio.sleep(delay)
+        else:
+            breaker.record_success()
+            return xws
+
+
+async def close_session():
+    """Closes the shared session and its pooled connections."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
@@ -0,0 +1,203 @@
+"""Two-tier cache of XWS lists fetched from RollBetter.
+
+The same list link is often pasted many times in league and tournament
+channels. Fetched lists are kept in an in-memory LRU and in an SQLite file
+that survives restarts, both keyed by the canonical form of the YASB link
+and both bounded in size. Entries expire after XWS_CACHE_TTL seconds so
+point changes published upstream are picked up eventually. Expired entries
+stay until evicted, to be served when RollBetter is unavailable.
+
+Cached dicts are shared between callers and must be treated as read-only.
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, quote, urlencode, urlsplit, urlunsplit
+
+from bot import config, metrics
+
+logger = logging.getLogger(__name__)
+
+
+def canonical_yasb_url(url):
+    """Returns the cache key of a YASB link.
+
+    The scheme, host case, "/preview" path, fragment, empty parameters and
+    parameter order do not change the list a link describes, so they are
+    normalized away.
+    """
+    parts = urlsplit(url.strip())
+    query = sorted(parse_qsl(parts.query))
+    return urlunsplit(
+        (
+            "https",
+            parts.netloc.lower(),
+            "/",
+            urlencode(query, quote_via=quote),
+            "",
+        )
+    )
+
+
+class XwsCache:
+    """In-memory LRU in front of an optional SQLite store.
+
+    Args:
+        path (str | None): SQLite file of the disk tier, None or "" to
+            keep entries in memory only.
+        memory_entries (int): Lists kept in memory.
+        disk_entries (int): Lists kept on disk, oldest evicted first.
+        ttl (float): Seconds an entry stays valid.
+    """
+
+    def __init__(
+        self, path=None, memory_entries=512, disk_entries=20000, ttl=86400
+    ):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._db = None
+        # Rows of the disk tier, counted once per connection
+        self._disk_count = 0
+        self._db_lock = threading.Lock()
+
+    # --- Memory Tier ---
+    def _memory_get(self, key, now, allow_stale):
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        if not allow_stale and now - entry[0] > self.ttl:
+            return None
+        self._memory.move_to_end(key)
+        return entry
+
+    def _memory_put(self, key, stored_at, xws):
+        self._memory[key] = (stored_at, xws)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            metrics.increment("xws_cache.memory_evictions")
+
+    # --- Disk Tier ---
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS xws_cache ("
+                "key TEXT PRIMARY KEY, xws TEXT NOT NULL, "
+                "stored_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS xws_cache_stored_at "
+                "ON xws_cache (stored_at)"
+            )
+            self._db.commit()
+            (self._disk_count,) = self._db.execute(
+                "SELECT COUNT(*) FROM xws_cache"
+            ).fetchone()
+        return self._db
+
+    def _disk_get(self, key, now, allow_stale):
+        with self._db_lock:
+            row = (
+                self._connect()
+                .execute(
+                    "SELECT xws, stored_at FROM xws_cache WHERE key = ?",
+                    (key,),
+                )
+                .fetchone()
+            )
+        if row is None or (not allow_stale and now - row[1] > self.ttl):
+            return None
+        return row[1], json.loads(row[0])
+
+    def _disk_put(self, key, stored_at, xws):
+        with self._db_lock:
+            db = self._connect()
+            params = (json.dumps(xws), stored_at, key)
+            updated = db.execute(
+                "UPDATE xws_cache SET xws = ?, stored_at = ? WHERE key = ?",
+                params,
+            ).rowcount
+            if not updated:
+                db.execute(
+                    "INSERT INTO xws_cache (xws, stored_at, key) "
+                    "VALUES (?, ?, ?)",
+                    params,
+                )
+                self._disk_count += 1
+            if self._disk_count > self.disk_entries:
+                evicted = db.execute(
+                    "DELETE FROM xws_cache WHERE key IN (SELECT key FROM "
+                    "xws_cache ORDER BY stored_at LIMIT ?)",
+                    (self._disk_count - self.disk_entries,),
+                ).rowcount
+                self._disk_count -= evicted
+                metrics.increment("xws_cache.disk_evictions", evicted)
+            db.commit()
+
+    # --- Public API ---
+    async def get(self, url, allow_stale=False):
+        """Returns the cached XWS of a YASB link, None on a miss.
+
+        Args:
+            url (str): The YASB link.
+            allow_stale (bool): Also return entries past their TTL.
+        """
+        key = canonical_yasb_url(url)
+        now = time.time()
+        entry = self._memory_get(key, now, allow_stale)
+        if entry is not None:
+            metrics.increment("xws_cache.memory_hits")
+            return entry[1]
+        if self.path:
+            try:
+                entry = await asyncio.to_thread(
+                    self._disk_get, key, now, allow_stale
+                )
+            except (sqlite3.Error, ValueError) as e:
+                logger.warning(f"XWS cache read failed: {e}")
+                entry = None
+            if entry is not None:
+                metrics.increment("xws_cache.disk_hits")
+                self._memory_put(key, *entry)
+                return entry[1]
+        metrics.increment("xws_cache.misses")
+        return None
+
+    async def put(self, url, xws):
+        """Stores the XWS of a YASB link in both tiers."""
+        key = canonical_yasb_url(url)
+        stored_at = time.time()
+        self._memory_put(key, stored_at, xws)
+        if self.path:
+            try:
+                await asyncio.to_thread(self._disk_put, key, stored_at, xws)
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                logger.warning(f"XWS cache write failed: {e}")
+
+    def close(self):
+        """Closes the SQLite connection, reopened on next use."""
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def __len__(self):
+        return len(self._memory)
+
+
+xws_cache = XwsCache(
+    path=config.XWS_CACHE_PATH,
+    memory_entries=config.XWS_CACHE_MEMORY_ENTRIES,
+    disk_entries=config.XWS_CACHE_DISK_ENTRIES,
+    ttl=config.XWS_CACHE_TTL,
+)
+metrics.register_gauge("xws_cache.memory_size", xws_cache.__len__)
@@ -0,0 +1,6 @@
+import os
+
+# main.py logs to a file unless LOG_FILE is empty, keep test runs from
+# writing xwsbot.log into the working tree. Set before bot.config is
+# imported by the test modules.
+os.environ["LOG_FILE"] = ""
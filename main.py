@@ -1,35 +1,48 @@
 import asyncio
-import json
+import functools
 import logging
 import random
 
 import aiohttp
 import discord
 from discord import ButtonStyle, Interaction
+from discord.ext import tasks
 from discord.ui import Button, View, button
 
-from bot import config
-from bot.mongo.init_db import prepare_collections
-from bot.mongo.search import (
+from bot import config, metrics, rollbetter
+from bot.concurrency import (
+    FairScheduler,
+    LockRegistry,
+    OrderedLock,
+    QueueFullError,
+    SingleFlight,
+)
+from bot.mongo.async_search import (
+    close_db_connection,
     find_faction,
-    find_pilot,
-    find_ship_by_pilot,
-    find_upgrade,
+    find_pilots_with_ships_many,
+    find_upgrades_many,
+    refresh_catalog,
+    warm_up_db_connection,
 )
+from bot.mongo.models import ShipRecord, UpgradeRecord
+from bot.mongo.init_db import prepare_collections
+from bot.mongo.search import load_catalog
 from bot.xws2pretty import convert_faction_to_color, ini_emojis, ship_emojis
+from bot.xws_cache import canonical_yasb_url, xws_cache
 
 # --- Logging Setup ---
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
-log_file = "xwsbot.log"
-file_handler = logging.FileHandler(log_file, encoding="utf-8")
 formatter = logging.Formatter(
     "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
 )
-file_handler.setFormatter(formatter)
+if config.LOG_FILE:
+    file_handler = logging.FileHandler(config.LOG_FILE, encoding="utf-8")
+    file_handler.setFormatter(formatter)
+    logger.addHandler(file_handler)
 stream_handler = logging.StreamHandler()
 stream_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
 logger.addHandler(stream_handler)
 
 # --- Discord Bot Setup ---
@@ -38,10 +51,39 @@ intents.messages = True
 intents.message_content = True
 intents.members = True
 intents.presences = True
-bot = discord.Bot(intents=intents)
+
+
+class XwsBot(discord.Bot):
+    """discord.Bot that also closes the shared RollBetter session."""
+
+    async def close(self):
+        # Runs on the bot's loop, which is gone once bot.run() returns
+        await rollbetter.close_session()
+        await super().close()
+
+
+bot = XwsBot(intents=intents)
 
 # --- Concurrency Control ---
-channel_locks = {}
+# OrderedLock per channel, sequencing the replies to its YASB links
+channel_locks = LockRegistry(
+    OrderedLock, config.CHANNEL_LOCKS_MAX, name="channel_locks"
+)
+metrics.register_gauge("channel_locks.size", channel_locks.__len__)
+# Caps list loads across all guilds and shares workers fairly between them
+scheduler = FairScheduler(
+    workers=config.WORKERS,
+    max_queued=config.QUEUE_MAX,
+    max_queued_per_guild=config.QUEUE_MAX_PER_GUILD,
+    per_guild=config.WORKERS_PER_GUILD,
+    per_user=config.WORKERS_PER_USER,
+)
+metrics.register_gauge("scheduler.queued", lambda: scheduler.queued)
+metrics.register_gauge("scheduler.running", lambda: scheduler.running)
+
+
+# Stand-in for pilots whose ship could not be resolved
+UNKNOWN_SHIP = ShipRecord(xws="unknown", name="Unknown Ship", size="?")
 
 
 # --- Helper Functions ---
@@ -63,6 +105,18 @@ def get_gamemode(yasb_url: str) -> tuple[str, int] | None:
         return None
 
 
+def find_yasb_urls(content: str) -> list[str]:
+    """Returns the distinct YASB links of a message, in order of appearance.
+
+    Links to the same list (see canonical_yasb_url) count once.
+    """
+    found = {}
+    for match in config.YASB_URL_PATTERN.finditer(content):
+        url = match.group(0).replace("http://", "https://", 1)
+        found.setdefault(canonical_yasb_url(url), url)
+    return list(found.values())
+
+
 def get_ship_stat_value(stats_list, stat_type_to_find):
     """Safely extracts a specific stat value from a ship's stats list."""
     if not isinstance(stats_list, list):
@@ -73,44 +127,499 @@ def get_ship_stat_value(stats_list, stat_type_to_find):
     return None
 
 
-def calculate_upgrade_cost(upgrade_data, ship_details, pilot_info):
-    """Calculates the potentially variable cost of an upgrade."""
-    if not isinstance(upgrade_data, dict):
-        return None
-    cost_obj = upgrade_data.get("cost")
-    if not isinstance(cost_obj, dict):
+def calculate_upgrade_cost(upgrade, ship, pilot):
+    """Calculates the potentially variable cost of an upgrade.
+
+    Args:
+        upgrade (UpgradeRecord | None): The upgrade to price.
+        ship (ShipRecord | None): Ship of the pilot equipping it.
+        pilot (PilotRecord | None): The pilot equipping it.
+    """
+    if upgrade is None or upgrade.cost is None:
         return None
-    if "value" in cost_obj:
+    return upgrade.cost.lookup(
+        size=ship.size if ship else None,
+        agility=ship.agility if ship else None,
+        initiative=pilot.initiative if pilot else None,
+    )
+
+
+# --- List Loading ---
+async def fetch_list(yasb_url, log_context):
+    """Returns the XWS of a YASB link, cached or fetched from RollBetter.
+
+    When RollBetter cannot be reached, an expired cached copy of the list
+    is served if there is one.
+
+    Raises:
+        CircuitOpenError: If RollBetter is failing and was not called.
+        aiohttp.ClientError: If the RollBetter request fails.
+        asyncio.TimeoutError: If RollBetter does not answer in time.
+    """
+    xws_dict = await xws_cache.get(yasb_url)
+    if xws_dict is not None:
+        logger.info("Served XWS from cache", extra=log_context)
+        return xws_dict
+    try:
+        xws_dict = await rollbetter.fetch_xws(yasb_url)
+    except (
+        rollbetter.CircuitOpenError,
+        aiohttp.ClientError,
+        asyncio.TimeoutError,
+    ) as e:
+        xws_dict = await xws_cache.get(yasb_url, allow_stale=True)
+        if xws_dict is None:
+            raise
+        logger.warning(
+            f"RollBetter unavailable ({e!r}), serving expired cached XWS",
+            extra=log_context,
+        )
+        return xws_dict
+    logger.debug("Received XWS JSON", extra=log_context)
+    await xws_cache.put(yasb_url, xws_dict)
+    return xws_dict
+
+
+def _pilot_details(xws_pilots, pilots_with_ships, upgrades_by_id):
+    """Pairs the pilots of an XWS list with their ship and upgrades."""
+    pilot_details_list = []
+    for pilot_entry in xws_pilots:
+        pilot_id = pilot_entry.get("id")
+        if not pilot_id:
+            continue
+
+        pilot = pilots_with_ships.get(pilot_id)
+        if pilot is None:
+            continue
+        ship = pilot.ship
+        if ship is None or not ship.xws:
+            ship = UNKNOWN_SHIP
+
+        upgrades = []
+        for upgrade_ids in pilot_entry.get("upgrades", {}).values():
+            if isinstance(upgrade_ids, list):
+                for upgrade_id in upgrade_ids:
+                    upgrade = upgrades_by_id.get(upgrade_id)
+                    if upgrade is None:
+                        upgrade = UpgradeRecord(
+                            xws=upgrade_id, name=f"{upgrade_id}", image=""
+                        )
+                    upgrades.append(upgrade)
+
+        pilot_details_list.append((pilot, ship, upgrades))
+    return pilot_details_list
+
+
+async def resolve_lists(xws_lists):
+    """Resolves the factions, pilots, ships and upgrades of XWS lists.
+
+    The cards of all the lists are looked up together, in one query per
+    collection.
+
+    Args:
+        xws_lists (list[dict]): XWS lists with a faction and pilots.
+
+    Returns:
+        list[tuple]: Per list, the faction dict and a (pilot, ship,
+            upgrades) tuple per pilot found in the catalog.
+    """
+    xws_pilots = [p for xws in xws_lists for p in xws.get("pilots", [])]
+    pilot_ids = list(dict.fromkeys(p.get("id") for p in xws_pilots))
+    upgrade_ids = list(
+        dict.fromkeys(
+            upgrade_id
+            for p in xws_pilots
+            for upgrade_ids in p.get("upgrades", {}).values()
+            if isinstance(upgrade_ids, list)
+            for upgrade_id in upgrade_ids
+        )
+    )
+    faction_ids = list(dict.fromkeys(xws["faction"] for xws in xws_lists))
+    pilots_with_ships, upgrades_by_id, *factions = await asyncio.gather(
+        find_pilots_with_ships_many(pilot_ids),
+        find_upgrades_many(upgrade_ids),
+        *(find_faction(faction_xws) for faction_xws in faction_ids),
+    )
+    faction_by_id = dict(zip(faction_ids, factions))
+
+    resolved = []
+    for xws in xws_lists:
+        faction_xws = xws["faction"]
+        faction_details = faction_by_id[faction_xws] or {
+            "name": faction_xws.replace("_", " ").title()
+        }
+        resolved.append(
+            (
+                faction_details,
+                _pilot_details(
+                    xws["pilots"], pilots_with_ships, upgrades_by_id
+                ),
+            )
+        )
+    return resolved
+
+
+async def load_lists(yasb_urls, log_context):
+    """Fetches YASB lists concurrently and resolves their cards together.
+
+    Returns:
+        list: Per link, in order, the exception raised while fetching it
+            or an (xws_dict, faction_details, pilot_details_list) tuple.
+            The last two are None when the list has no faction or pilots.
+    """
+    fetched = await asyncio.gather(
+        *(
+            list_fetches.do(
+                canonical_yasb_url(url),
+                functools.partial(
+                    fetch_list, url, {**log_context, "yasb_url": url}
+                ),
+            )
+            for url in yasb_urls
+        ),
+        return_exceptions=True,
+    )
+    complete = [
+        index
+        for index, xws in enumerate(fetched)
+        if isinstance(xws, dict) and xws.get("faction") and xws.get("pilots")
+    ]
+    resolved = {}
+    if complete:
+        resolved = dict(
+            zip(complete, await resolve_lists([fetched[i] for i in complete]))
+        )
+        logger.info(
+            "Successfully processed pilot/upgrade data", extra=log_context
+        )
+    return [
+        (
+            xws
+            if isinstance(xws, BaseException)
+            else (xws, *resolved.get(index, (None, None)))
+        )
+        for index, xws in enumerate(fetched)
+    ]
+
+
+# Concurrent requests for the same lists share one load_lists call, and
+# concurrent fetches of the same list share one fetch_list call
+list_loads = SingleFlight("list_loads")
+list_fetches = SingleFlight("list_fetches")
+
+
+# --- List Rendering ---
+def build_list_embeds(
+    found_url, xws_dict, faction_details, pilot_details_list, log_context
+):
+    """Renders a resolved list into embeds, without footers.
+
+    Returns:
+        list[discord.Embed]: The list split over as many embeds as the
+            description limit requires.
+    """
+    # --- Extract Core List Info ---
+    faction_xws = xws_dict.get("faction")
+    faction_color = convert_faction_to_color(faction_xws)
+    squad_name = xws_dict.get("name", "Unnamed Squad")
+    squad_points_xws = xws_dict.get("points")
+    yasb_link = xws_dict.get("vendor", {}).get("yasb", {}).get("link")
+
+    squad_gamemode_info = get_gamemode(yasb_link) if yasb_link else None
+    if not squad_gamemode_info and yasb_link:
+        logger.warning(
+            f"Could not extract game mode from YASB link: {yasb_link}",
+            extra=log_context,
+        )
+
+    game_mode_name = (
+        squad_gamemode_info[0] if squad_gamemode_info else "Unknown"
+    )
+    points_limit = str(squad_gamemode_info[1]) if squad_gamemode_info else "?"
+    display_points = (
+        str(squad_points_xws) if squad_points_xws is not None else "?"
+    )
+    bid_str = "?"
+    if squad_gamemode_info and squad_points_xws is not None:
         try:
-            return int(cost_obj["value"])
+            bid = squad_gamemode_info[1] - int(squad_points_xws)
+            bid_str = str(bid)
         except (ValueError, TypeError):
-            return None
-    if "variable" in cost_obj:
-        variable_type = cost_obj.get("variable")
-        values_dict = cost_obj.get("values")
-        if not isinstance(values_dict, dict):
-            return None
-        lookup_key = None
-        ship_stats = ship_details.get("stats") if ship_details else None
-        if variable_type == "size":
-            lookup_key = ship_details.get("size") if ship_details else None
-        elif variable_type == "agility":
-            agility = get_ship_stat_value(ship_stats, "agility")
-            if agility is not None:
-                lookup_key = str(agility)
-        elif variable_type == "initiative":
-            initiative = pilot_info.get("initiative") if pilot_info else None
-            if initiative is not None:
-                lookup_key = str(initiative)
-        if lookup_key is not None:
-            raw_cost = values_dict.get(lookup_key)
-            if raw_cost is not None:
-                try:
-                    return int(raw_cost)
-                except (ValueError, TypeError):
-                    return None
+            pass
+
+    # --- Build Embeds ---
+    squad_hyperlink = (
+        f"[{squad_name}]({found_url})" if found_url else squad_name
+    )
+    embed_list_title = (
+        f"**{squad_hyperlink}**\n"
+        f"{faction_details.get('name', 'Unknown Faction')} "
+        f"[{display_points}/{points_limit}: {game_mode_name}]\n"
+        f"-# Bid: {bid_str}\n"
+    )
+
+    embeds_to_send = []
+    current_description = embed_list_title
+
+    for pilot, ship, upgrades in pilot_details_list:
+        pilot_total_cost = pilot.cost or 0
+        pilot_cost = pilot.cost if pilot.cost is not None else "?"
+
+        ship_emoji = ship_emojis.get(ship.xws, "❓")
+        ini_emoji = ini_emojis.get(pilot.initiative, "❓")
+        pilot_name = pilot.name or "Unknown Pilot"
+        pilot_image = (
+            pilot.image
+            if pilot.image is not None
+            else config.GOLDENROD_PILOTS_URL
+        )
+
+        upgrade_display_parts = []
+        for upg in upgrades:
+            cost = calculate_upgrade_cost(upg, ship, pilot)
+            if cost is not None:
+                pilot_total_cost += cost
+            cost_str = f"({cost})" if cost is not None else "(?)"
+            upg_name = upg.name or "Unknown Upgrade"
+            img_url = (
+                upg.image
+                if upg.image is not None
+                else config.GOLDENROD_UPGRADES_URL
+            )
+            if img_url:
+                upgrade_display_parts.append(
+                    f"[{upg_name}]({img_url}){cost_str}"
+                )
+            else:
+                upgrade_display_parts.append(
+                    f"[{upg_name}]({img_url}){cost_str}"
+                )
+
+        upgrades_formatted = (
+            f"{', '.join(upgrade_display_parts)}"
+            if upgrade_display_parts
+            else ""
+        )
+        # If pilot has no upgrades display cost in square brackets
+        if upgrades_formatted == "":
+            pilot_cost_str = f"__**[{pilot_cost}]**__"
+            pilot_total_str = ""
+        else:
+            pilot_cost_str = f"({pilot_cost}):"
+            pilot_total_str = f" __**[{pilot_total_cost}]**__"
+        # Constuct all parts of a pilot line for embed description
+        pilot_line_base = f"{ship_emoji} {ini_emoji}"
+        pilot_line_base += f"**[{pilot_name}]({pilot_image})**"
+        pilot_line_base += f"{pilot_cost_str}"
+
+        final_pilot_line = (
+            f"{pilot_line_base} {upgrades_formatted} {pilot_total_str}\n"
+        )
+
+        if (
+            len(current_description) + len(final_pilot_line)
+            > config.DISCORD_EMBED_DESCRIPTION_LIMIT
+        ):
+            embed = discord.Embed(
+                description=current_description,
+                color=faction_color,
+            )
+            embeds_to_send.append(embed)
+            current_description = final_pilot_line
+        else:
+            current_description += final_pilot_line
+
+    if current_description:
+        embed = discord.Embed(
+            description=current_description, color=faction_color
+        )
+        embeds_to_send.append(embed)
+
+    return embeds_to_send
+
+
+def pack_embeds(embeds):
+    """Groups embeds into the fewest messages Discord accepts, in order.
+
+    A message carries at most config.DISCORD_MESSAGE_EMBEDS_LIMIT embeds
+    totalling at most config.DISCORD_MESSAGE_EMBED_CHARS_LIMIT characters.
+    Filling each message before starting the next is optimal since the
+    order of the embeds is kept.
+
+    Returns:
+        list[list[discord.Embed]]: The embeds of each message.
+    """
+    batches = []
+    batch, batch_chars = [], 0
+    for embed in embeds:
+        chars = len(embed)
+        if batch and (
+            len(batch) >= config.DISCORD_MESSAGE_EMBEDS_LIMIT
+            or batch_chars + chars > config.DISCORD_MESSAGE_EMBED_CHARS_LIMIT
+        ):
+            batches.append(batch)
+            batch, batch_chars = [], 0
+        batch.append(embed)
+        batch_chars += chars
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def load_error_reply(error, message, found_url, log_context):
+    """Logs why a list could not be fetched and returns the reply, if any."""
+    if isinstance(error, aiohttp.ClientResponseError):
+        # Handles response.raise_for_status() errors
+        logger.error(
+            f"HTTP error fetching XWS: {error.status} {error.message}",
+            extra=log_context,
+            exc_info=error,
+        )
         return None
-    return None
+    if isinstance(error, asyncio.TimeoutError):
+        # aiohttp uses asyncio.TimeoutError for timeouts
+        logger.error(
+            f"Timeout fetching XWS data from {config.RB_ENDPOINT}{found_url}",
+            extra=log_context,
+        )
+        return None
+    if isinstance(error, aiohttp.ClientError):
+        # Catches other connection errors
+        logger.error(
+            f"Failed to fetch XWS data (aiohttp ClientError): {error}",
+            extra=log_context,
+            exc_info=error,
+        )
+        return None
+    if isinstance(error, rollbetter.CircuitOpenError):
+        logger.warning(
+            "RollBetter circuit open, request not sent", extra=log_context
+        )
+        return (
+            f"Sorry {message.author.display_name}, the list service is "
+            "unavailable right now. Please try again in a minute."
+        )
+    logger.error(
+        f"Unexpected error during XWS fetch/parse: {error}",
+        extra=log_context,
+        exc_info=error,
+    )
+    return (
+        f"Sorry {message.author.display_name}, "
+        "an unexpected error occurred while getting list data"
+    )
+
+
+async def send_lists(message, found_urls, results, log_context, skipped=0):
+    """Replies to a message with its rendered lists and the delete buttons.
+
+    Lists that could not be rendered, and links skipped over the per
+    message limit, are explained in a single message sent before the
+    embeds.
+
+    Args:
+        message (discord.Message): The message containing the links.
+        found_urls (list[str]): The YASB links.
+        results (list): The result of load_lists for found_urls.
+        log_context (dict): Extra fields of the log records.
+        skipped (int): Further links of the message that were not loaded.
+    """
+    notices = []
+    if skipped:
+        notices.append(
+            f"{message.author.mention}, I show at most "
+            f"{config.MAX_LISTS_PER_MESSAGE} lists per message, "
+            f"{skipped} more list link(s) were skipped."
+        )
+    embeds_to_send = []
+    for found_url, result in zip(found_urls, results):
+        url_context = {**log_context, "yasb_url": found_url}
+        if isinstance(result, BaseException):
+            notice = load_error_reply(result, message, found_url, url_context)
+            if notice:
+                notices.append(notice)
+            continue
+        xws_dict, faction_details, pilot_details_list = result
+        if not xws_dict.get("faction"):
+            logger.error("Faction missing in XWS data.", extra=url_context)
+            notices.append(
+                f"Sorry {message.author.mention}, "
+                "list data incomplete (missing faction)."
+            )
+        elif pilot_details_list is None:
+            logger.warning("No pilots found in list.", extra=url_context)
+            notices.append(
+                f"The list appears to be empty, {message.author.mention}."
+            )
+        else:
+            embeds_to_send += build_list_embeds(
+                found_url,
+                xws_dict,
+                faction_details,
+                pilot_details_list,
+                url_context,
+            )
+
+    if notices:
+        await message.channel.send("\n".join(notices))
+        if not embeds_to_send:
+            return
+
+    # --- Send Embeds ---
+    if not embeds_to_send:
+        logger.warning("No embeds generated.", extra=log_context)
+        return
+
+    total_embeds = len(embeds_to_send)
+    random_phrase = random.choice(config.FOOTER_PHRASES)
+    base_footer_text = f"{random_phrase} {message.author.display_name}"
+    footer_icon_url = (
+        message.author.display_avatar.url
+        if message.author.display_avatar
+        else None
+    )
+    for i, embed in enumerate(embeds_to_send):
+        part_counter = f"\n[Part {i + 1}/{total_embeds}]"
+        footer_text = (
+            f"{base_footer_text}{part_counter}"
+            if total_embeds > 1
+            else base_footer_text
+        )
+        embed.set_footer(text=footer_text, icon_url=footer_icon_url)
+
+    # Footers count towards the per message limit, so pack once they are set
+    batches = pack_embeds(embeds_to_send)
+    logger.info(
+        f"Sending {total_embeds} embed(s) in {len(batches)} message(s).",
+        extra=log_context,
+    )
+    for batch in batches[:-1]:
+        await message.channel.send(embeds=batch)
+
+    # --- Send Last Embeds With Confirmation Buttons ---
+    try:
+        view = ConfirmationView(
+            original_message=message
+        )  # Pass the original user message
+    except Exception as e_view:
+        logger.error(
+            f"Failed to create confirmation buttons: {e_view}",
+            extra=log_context,
+            exc_info=True,
+        )
+        await message.channel.send(embeds=batches[-1])
+        return
+    view.button_message = await message.channel.send(
+        f"Query for {message.author.display_name}: "
+        " Delete original message containing the YASB link?",
+        embeds=batches[-1],
+        view=view,
+    )
+    logger.info(
+        f"Sent {total_embeds} embed(s) with confirmation buttons for "
+        f"message {message.id}",
+        extra=log_context,
+    )
 
 
 # --- Confirmation Button View ---
@@ -174,6 +683,21 @@ class ConfirmationView(View):
                     None  # Clear reference after attempting delete
                 )
 
+    async def _remove_buttons(self, log_context):
+        """Strips the question and buttons from the list message."""
+        if self.button_message is None:
+            return
+        try:
+            await self.button_message.edit(content=None, view=None)
+        except discord.HTTPException as e:
+            logger.warning(
+                f"Could not remove buttons from message "
+                f"{self.button_message.id}: {e}",
+                extra=log_context,
+            )
+        finally:
+            self.button_message = None
+
     @button(
         label="Yes (Delete Original)",
         style=ButtonStyle.success,
@@ -229,13 +753,8 @@ class ConfirmationView(View):
             confirmation_text += "message deletion sub-routine."
             self.message_deleted = False
 
-        try:
-            await interaction.delete_original_response()
-        except discord.HTTPException as e:
-            logger.warning(
-                f"Could not delete confirmation message: {e}",
-                extra=log_context,
-            )
+        # The buttons ride on the last list message, keep the list
+        await self._remove_buttons(log_context)
 
         if confirmation_text:
             await interaction.followup.send(
@@ -265,13 +784,8 @@ class ConfirmationView(View):
         confirmation_text = ""
         self.message_deleted = False
 
-        try:
-            await interaction.delete_original_response()
-        except discord.HTTPException as e:
-            logger.warning(
-                f"Could not delete confirmation message: {e}",
-                extra=log_context,
-            )
+        # The buttons ride on the last list message, keep the list
+        await self._remove_buttons(log_context)
 
         if confirmation_text:
             await interaction.followup.send(
@@ -295,7 +809,28 @@ class ConfirmationView(View):
             " timed out.",
             extra=log_context,
         )
-        await self._delete_button_message(log_context)
+        if self.button_message is not None and self.button_message.embeds:
+            # The buttons ride on the last list message, keep the list
+            await self._remove_buttons(log_context)
+        else:
+            await self._delete_button_message(log_context)
+
+
+# --- Background Tasks ---
+@tasks.loop(seconds=config.CATALOG_REFRESH_INTERVAL)
+async def catalog_refresh():
+    """Reloads the card catalog after the database was reloaded."""
+    try:
+        if await refresh_catalog():
+            logger.info("Card catalog reloaded from the updated database.")
+    except Exception as e:
+        logger.error(f"Card catalog refresh failed: {e}", exc_info=True)
+
+
+@tasks.loop(seconds=config.METRICS_LOG_INTERVAL)
+async def metrics_report():
+    """Logs the cache, RollBetter, lock and queue metrics."""
+    logger.info(f"Metrics: {metrics.format_snapshot()}")
 
 
 # --- Bot Events ---
@@ -307,6 +842,18 @@ async def on_ready():
     logger.info("Persistent Builders view added.")
     bot.add_view(Rules())
     logger.info("Persistent Rules view added.")
+    if await warm_up_db_connection():
+        logger.info("MongoDB connection pool warmed up.")
+    if await rollbetter.warm_up():
+        logger.info("RollBetter connection warmed up.")
+    if (
+        config.STORAGE_BACKEND == "mongo"
+        and config.CATALOG_REFRESH_INTERVAL > 0
+        and not catalog_refresh.is_running()
+    ):
+        catalog_refresh.start()
+    if config.METRICS_LOG_INTERVAL > 0 and not metrics_report.is_running():
+        metrics_report.start()
 
 
 @bot.event
@@ -314,356 +861,77 @@ async def on_message(message: discord.Message):
     if message.author == bot.user or not message.content:
         return
 
-    yasb_url_match = config.YASB_URL_PATTERN.search(message.content)
-    if not yasb_url_match:
+    found_urls = find_yasb_urls(message.content)
+    if not found_urls:
         return
+    skipped = max(0, len(found_urls) - config.MAX_LISTS_PER_MESSAGE)
+    found_urls = found_urls[: config.MAX_LISTS_PER_MESSAGE]
+
+    # Lists load concurrently; replies go out in the order links arrived
+    lock = channel_locks.get(message.channel.id)
+    turn = lock.turn()
+    log_context = {
+        "channel_id": message.channel.id,
+        "user_id": message.author.id,
+        "user_name": message.author.name,
+        "yasb_urls": found_urls,
+    }
 
-    lock = channel_locks.setdefault(message.channel.id, asyncio.Lock())
-    async with lock:
-        log_context = {
-            "channel_id": message.channel.id,
-            "user_id": message.author.id,
-            "user_name": message.author.name,
-        }
-        logger.info("Acquired lock", extra=log_context)
-
-        try:
-            found_url = yasb_url_match.group(0).replace(
-                "http://", "https://", 1
-            )
-            log_context["yasb_url"] = found_url
+    try:
+        logger.info(
+            f"Processing request for {len(found_urls)} URL(s): "
+            f"{', '.join(found_urls)}",
+            extra=log_context,
+        )
+        if skipped:
             logger.info(
-                f"Processing locked request for URL: {found_url}",
+                f"Skipping {skipped} URL(s) over the per message limit",
                 extra=log_context,
             )
 
-            # --- Fetch XWS Data ---
-            rollbetter_url = config.RB_ENDPOINT + found_url
-            xws_dict = None
-            async with aiohttp.ClientSession() as session:
-                try:
-                    async with session.get(
-                        rollbetter_url, timeout=20
-                    ) as response:
-                        response.raise_for_status()
-                        response_text = await response.text()
-                        xws_dict = json.loads(response_text)
-                        logger.debug("Received XWS JSON", extra=log_context)
-                except (
-                    aiohttp.ClientResponseError
-                ) as e:  # Handles response.raise_for_status() errors
-                    logger.error(
-                        f"HTTP error fetching XWS: {e.status} {e.message}",
-                        extra=log_context,
-                        exc_info=True,
-                    )
-                    return
-                except (
-                    asyncio.TimeoutError
-                ):  # aiohttp uses asyncio.TimeoutError for timeouts
-                    logger.error(
-                        f"Timeout fetching XWS data from {rollbetter_url}",
-                        extra=log_context,
-                    )
-                    return
-                except (
-                    aiohttp.ClientError
-                ) as e:  # Catches other connection errors
-                    logger.error(
-                        f"Failed to fetch XWS data (aiohttp ClientError): {e}",
-                        extra=log_context,
-                        exc_info=True,
-                    )
-                    return
-                # Catch unexpected errors during the fetch/parse block
-                except Exception as e_fetch:
-                    logger.error(
-                        f"Unexpected error during XWS fetch/parse: {e_fetch}",
-                        extra=log_context,
-                        exc_info=True,
-                    )
-                    await message.channel.send(
-                        f"Sorry {message.author.display_name}, "
-                        "an unexpected error occurred while getting list data",
-                        ephemeral=True,
-                    )
-                    return
-
-            if xws_dict is None:
-                # Error message already sent in the except blocks
-                return
-
-            # --- Extract Core List Info ---
-            faction_xws = xws_dict.get("faction")
-            faction_color = convert_faction_to_color(faction_xws)
-            squad_name = xws_dict.get("name", "Unnamed Squad")
-            squad_points_xws = xws_dict.get("points")
-            yasb_link = xws_dict.get("vendor", {}).get("yasb", {}).get("link")
-
-            if not faction_xws:
-                logger.error("Faction missing in XWS data.", extra=log_context)
-                await message.channel.send(
-                    f"Sorry {message.author.mention}, "
-                    "list data incomplete (missing faction)."
-                )
-                return
-
-            faction_details = find_faction(faction_xws)
-            if not faction_details:
-                faction_details = {
-                    "name": faction_xws.replace("_", " ").title()
-                }
-
-            squad_gamemode_info = (
-                get_gamemode(yasb_link) if yasb_link else None
-            )
-            if not squad_gamemode_info and yasb_link:
-                logger.warning(
-                    f"Could not extract game mode from YASB link: {yasb_link}",
-                    extra=log_context,
-                )
-
-            game_mode_name = (
-                squad_gamemode_info[0] if squad_gamemode_info else "Unknown"
-            )
-            points_limit = (
-                str(squad_gamemode_info[1]) if squad_gamemode_info else "?"
+        # --- Load XWS Data (shared by concurrent identical requests) ---
+        guild_id = message.guild.id if message.guild else None
+        try:
+            results = await list_loads.do(
+                tuple(canonical_yasb_url(url) for url in found_urls),
+                lambda: scheduler.submit(
+                    guild_id,
+                    message.author.id,
+                    lambda: load_lists(found_urls, log_context),
+                ),
             )
-            display_points = (
-                str(squad_points_xws) if squad_points_xws is not None else "?"
+        except QueueFullError:
+            logger.warning(
+                "Work queue full, request turned away", extra=log_context
             )
-            bid_str = "?"
-            if squad_gamemode_info and squad_points_xws is not None:
-                try:
-                    bid = squad_gamemode_info[1] - int(squad_points_xws)
-                    bid_str = str(bid)
-                except (ValueError, TypeError):
-                    pass
-
-            # --- Process Pilots and Upgrades (Fetch DB Data) ---
-            pilot_details_list = []
-            xws_pilots = xws_dict.get("pilots", [])
-            if not xws_pilots:
-                logger.warning("No pilots found in list.", extra=log_context)
+            async with turn:
                 await message.channel.send(
-                    f"The list appears to be empty, {message.author.mention}.",
-                    ephemeral=True,
-                )
-                return
-
-            for pilot_entry in xws_pilots:
-                pilot_id = pilot_entry.get("id")
-                if not pilot_id:
-                    continue
-
-                pilot_info = find_pilot(pilot_id)
-                if not pilot_info:
-                    continue
-
-                ship_details = find_ship_by_pilot(pilot_info.get("xws"))
-                if not ship_details:
-                    ship_details = {
-                        "xws": "unknown",
-                        "name": "Unknown Ship",
-                        "size": "?",
-                        "stats": [],
-                    }
-
-                upgrades_data = []
-                for upgrade_type, upgrade_ids in pilot_entry.get(
-                    "upgrades", {}
-                ).items():
-                    if isinstance(upgrade_ids, list):
-                        for upgrade_id in upgrade_ids:
-                            upgrade_info = find_upgrade(
-                                upgrade_id
-                            )  # Uses global DB connection
-                            if not upgrade_info:
-                                upgrades_data.append(
-                                    {
-                                        "name": f"{upgrade_id}",
-                                        "sides": [{"image": ""}],
-                                    }
-                                )
-                            else:
-                                upgrades_data.append(upgrade_info)
-
-                pilot_details_list.append(
-                    {
-                        "pilot": pilot_info,
-                        "ship": ship_details,
-                        "upgrades": upgrades_data,
-                    }
+                    f"Sorry {message.author.display_name}, I am busy with a "
+                    "lot of lists right now. Please post yours again in a "
+                    "minute."
                 )
+            return
 
-            logger.info(
-                "Successfully processed pilot/upgrade data", extra=log_context
-            )
-
-            # --- Build Embeds ---
-            squad_hyperlink = (
-                f"[{squad_name}]({found_url})" if found_url else squad_name
-            )
-            embed_list_title = (
-                f"**{squad_hyperlink}**\n"
-                f"{faction_details.get('name', 'Unknown Faction')} "
-                f"[{display_points}/{points_limit}: {game_mode_name}]\n"
-                f"-# Bid: {bid_str}\n"
+        # --- Send Replies (in arrival order) ---
+        async with turn:
+            logger.info("Acquired lock", extra=log_context)
+            await send_lists(
+                message, found_urls, results, log_context, skipped
             )
 
-            embeds_to_send = []
-            current_description = embed_list_title
-
-            for details in pilot_details_list:
-                pilot, ship, upgrades = (
-                    details["pilot"],
-                    details["ship"],
-                    details["upgrades"],
-                )
-
-                pilot_total_cost = 0
-                try:
-                    pilot_total_cost += int(pilot.get("cost", 0))
-                except (ValueError, TypeError):
-                    pass
-
-                ship_emoji = ship_emojis.get(ship.get("xws"), "❓")
-                ini_emoji = ini_emojis.get(pilot.get("initiative"), "❓")
-                pilot_name = pilot.get("name", "Unknown Pilot")
-                pilot_image = pilot.get("image", config.GOLDENROD_PILOTS_URL)
-
-                upgrade_display_parts = []
-                for upg in upgrades:
-                    cost = calculate_upgrade_cost(upg, ship, pilot)
-                    if cost is not None:
-                        pilot_total_cost += cost
-                    cost_str = f"({cost})" if cost is not None else "(?)"
-                    upg_name = upg.get("name", "Unknown Upgrade")
-                    img_url = config.GOLDENROD_UPGRADES_URL
-                    try:
-                        if upg.get("sides") and upg["sides"][0]:
-                            img_url = upg["sides"][0].get(
-                                "image", config.GOLDENROD_UPGRADES_URL
-                            )
-                    except (IndexError, KeyError, TypeError):
-                        pass
-                    if img_url:
-                        upgrade_display_parts.append(
-                            f"[{upg_name}]({img_url}){cost_str}"
-                        )
-                    else:
-                        upgrade_display_parts.append(
-                            f"[{upg_name}]({img_url}){cost_str}"
-                        )
-
-                upgrades_formatted = (
-                    f"{', '.join(upgrade_display_parts)}"
-                    if upgrade_display_parts
-                    else ""
-                )
-                # If pilot has no upgrades display cost in square brackets
-                if upgrades_formatted == "":
-                    pilot_cost_str = f"__**[{pilot.get('cost', '?')}]**__"
-                    pilot_total_str = ""
-                else:
-                    pilot_cost_str = f"({pilot.get('cost', '?')}):"
-                    pilot_total_str = f" __**[{pilot_total_cost}]**__"
-                # Constuct all parts of a pilot line for embed description
-                pilot_line_base = f"{ship_emoji} {ini_emoji}"
-                pilot_line_base += f"**[{pilot_name}]({pilot_image})**"
-                pilot_line_base += f"{pilot_cost_str}"
-
-                final_pilot_line = (
-                    f"{pilot_line_base} {upgrades_formatted} "
-                    f"{pilot_total_str}\n"
-                )
-
-                if (
-                    len(current_description) + len(final_pilot_line)
-                    > config.DISCORD_EMBED_DESCRIPTION_LIMIT
-                ):
-                    embed = discord.Embed(
-                        description=current_description,
-                        color=faction_color,
-                    )
-                    embeds_to_send.append(embed)
-                    current_description = final_pilot_line
-                else:
-                    current_description += final_pilot_line
-
-            if current_description:
-                embed = discord.Embed(
-                    description=current_description, color=faction_color
-                )
-                embeds_to_send.append(embed)
-
-            # --- Send Embeds ---
-            if not embeds_to_send:
-                logger.warning("No embeds generated.", extra=log_context)
-            else:
-                total_embeds = len(embeds_to_send)
-                random_phrase = random.choice(config.FOOTER_PHRASES)
-                base_footer_text = (
-                    f"{random_phrase} {message.author.display_name}"
-                )
-                footer_icon_url = (
-                    message.author.display_avatar.url
-                    if message.author.display_avatar
-                    else None
-                )
-
-                logger.info(
-                    f"Sending {total_embeds} embed(s).", extra=log_context
-                )
-                for i, embed in enumerate(embeds_to_send):
-                    part_counter = f"\n[Part {i + 1}/{total_embeds}]"
-                    footer_text = (
-                        f"{base_footer_text}{part_counter}"
-                        if total_embeds > 1
-                        else base_footer_text
-                    )
-                    embed.set_footer(
-                        text=footer_text, icon_url=footer_icon_url
-                    )
-                    await message.channel.send(embed=embed)
-                logger.info("Finished sending embeds.", extra=log_context)
-
-                # --- Send Confirmation Buttons ---
-                try:
-                    view = ConfirmationView(
-                        original_message=message
-                    )  # Pass the original user message
-                    sent_button_message = await message.channel.send(
-                        f"Query for {message.author.display_name}: "
-                        " Delete original message containing the YASB link?",
-                        view=view,
-                    )
-                    view.button_message = sent_button_message
-                    logger.info(
-                        f"Sent confirmation buttons for message {message.id}",
-                        extra=log_context,
-                    )
-                except Exception as e_view:
-                    logger.error(
-                        f"Failed to send confirmation buttons: {e_view}",
-                        extra=log_context,
-                        exc_info=True,
-                    )
-                # --- End Send Confirmation ---
-
-        except Exception as e:
-            logger.error(
-                f"Unexpected error during processing: {e}",
-                extra=log_context,
-                exc_info=True,
-            )
-            await message.channel.send(
-                f"Sorry {message.author.mention}, "
-                "an unexpected error occurred.",
-                ephemeral=True,
-            )
-        finally:
-            logger.info("Released lock", extra=log_context)
+    except Exception as e:
+        logger.error(
+            f"Unexpected error during processing: {e}",
+            extra=log_context,
+            exc_info=True,
+        )
+        await message.channel.send(
+            f"Sorry {message.author.mention}, an unexpected error occurred."
+        )
+    finally:
+        # Lets the next list of the channel go out even after an error
+        turn.release()
+        logger.info("Released lock", extra=log_context)
 
 
 #  #########################
@@ -812,6 +1080,18 @@ async def this_is_the_wayre(ctx):
     await ctx.respond(random.choice(config.THE_WAY_GIFS))
 
 
+@bot.slash_command(
+    name="metrics",
+    description="Show the bot's cache, queue and RollBetter metrics.",
+    default_member_permissions=discord.Permissions(administrator=True),
+)
+async def show_metrics(ctx):
+    """Posts the current metrics snapshot, only visible to the caller."""
+    report = metrics.format_snapshot(separator="\n")
+    # Keeps the reply within Discord's 2000 characters per message
+    await ctx.respond(f"```\n{report[:1990]}\n```", ephemeral=True)
+
+
 # --- Bot Startup ---
 if __name__ == "__main__":
     if (
@@ -822,15 +1102,24 @@ if __name__ == "__main__":
         exit("Discord token configuration error.")
 
     try:
-        # --- Reinstate prepare_collections call ---
-        logger.info("Preparing data collections (if needed)...")
-        try:
-            prepare_collections(
-                config.XWS_DATA_ROOT_DIR, config.MONGODB_URI
-            )  # Pass required vars
-        finally:
-            logger.info("Data collections prepared.")
-        # --- End reinstate ---
+        if config.STORAGE_BACKEND == "mongo":
+            # --- Reinstate prepare_collections call ---
+            logger.info("Preparing data collections (if needed)...")
+            try:
+                prepare_collections(
+                    config.XWS_DATA_ROOT_DIR, config.MONGODB_URI
+                )  # Pass required vars
+            finally:
+                logger.info("Data collections prepared.")
+            # --- End reinstate ---
+
+        logger.info(
+            f"Loading card catalog into memory ({config.STORAGE_BACKEND})..."
+        )
+        if not load_catalog():
+            if config.STORAGE_BACKEND == "embedded":
+                raise FileNotFoundError(config.XWS_DATA_ROOT_DIR)
+            logger.warning("Card catalog unavailable, querying MongoDB.")
 
         logger.info("Starting bot...")
         bot.run(config.DISCORD_TOKEN)
@@ -848,3 +1137,6 @@ if __name__ == "__main__":
     except Exception as e:
         logger.critical(f"FATAL: Bot run failed: {e}", exc_info=True)
         exit("Unexpected error during bot startup.")
+    finally:
+        close_db_connection()
+        xws_cache.close()
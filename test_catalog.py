@@ -0,0 +1,379 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+from unittest.mock import ANY, MagicMock
+
+import pytest
+
+from bot.mongo import async_search, search, snapshot
+from bot.mongo.catalog import Catalog, build_cost_table
+from bot.mongo.models import PilotRecord, ShipRecord, UpgradeRecord
+
+# --- Mock Data ---
+MOCK_FANG_SHIP_DOC = {
+    "_id": "ship-1",
+    "name": "Fang Fighter",
+    "xws": "fangfighter",
+    "size": "small",
+    "stats": [{"type": "agility", "value": 3}],
+    "pilots": [
+        {"name": "Old Teroch", "xws": "oldteroch", "initiative": 5},
+        {"name": "Fenn Rau", "xws": "fennrau", "initiative": 6},
+    ],
+}
+MOCK_UPGRADE_DOCS = [
+    {
+        "_id": "upg-1",
+        "name": "Afterburners",
+        "xws": "afterburners",
+        "cost": {"value": 3},
+    },
+    {
+        "_id": "upg-3",
+        "name": "Stealth Device",
+        "xws": "stealthdevice",
+        "cost": {
+            "variable": "agility",
+            "values": {"0": 3, "1": 4, "2": 6, "3": 8},
+        },
+    },
+    {"_id": "upg-2", "name": "No xws"},
+]
+MOCK_FACTION_DOCS = [{"name": "Scum and Villainy", "xws": "scumandvillainy"}]
+
+
+def make_catalog():
+    catalog = Catalog()
+    catalog.load(
+        [dict(MOCK_FANG_SHIP_DOC)],
+        [dict(u) for u in MOCK_UPGRADE_DOCS],
+        [dict(f) for f in MOCK_FACTION_DOCS],
+    )
+    return catalog
+
+
+def test_catalog_starts_unloaded():
+    assert Catalog().loaded is False
+
+
+def test_catalog_indexes_pilots_and_ships():
+    catalog = make_catalog()
+    assert catalog.loaded is True
+    assert catalog.pilots["fennrau"].initiative == 6
+    assert catalog.pilots["oldteroch"].ship.xws == "fangfighter"
+    assert catalog.pilots["oldteroch"].ship is catalog.pilots["fennrau"].ship
+    assert catalog.pilots["oldteroch"].ship.agility == 3
+
+
+def test_catalog_indexes_upgrades_and_factions():
+    catalog = make_catalog()
+    assert list(catalog.upgrades) == ["afterburners", "stealthdevice"]
+    assert catalog.upgrades["afterburners"].cost.lookup() == 3
+    assert catalog.factions["scumandvillainy"]["name"] == "Scum and Villainy"
+
+
+def test_catalog_reload_replaces_previous_data():
+    catalog = make_catalog()
+    catalog.load([], [], [])
+    assert catalog.pilots == {}
+    assert catalog.upgrades == {}
+
+
+def test_find_many_served_from_catalog(mocker):
+    from bot.mongo import search
+    from bot.mongo.backends import CatalogBackend
+
+    mocker.patch.object(
+        search, "get_backend", return_value=CatalogBackend(make_catalog())
+    )
+    pilots = search.find_pilots_many(["oldteroch", "oldteroch", "", "nobody"])
+    assert list(pilots) == ["oldteroch"]
+    ships = search.find_ships_by_pilots_many(["oldteroch", "fennrau"])
+    assert ships["oldteroch"] is ships["fennrau"]
+    assert search.find_upgrades_many([]) == {}
+
+
+def test_embedded_backend_loads_data_dir(tmp_path):
+    from bot.mongo.backends import EmbeddedBackend
+
+    ship_dir = tmp_path / "pilots" / "scum-and-villainy"
+    ship_dir.mkdir(parents=True)
+    ship_doc = {k: v for k, v in MOCK_FANG_SHIP_DOC.items() if k != "_id"}
+    (ship_dir / "fang-fighter.json").write_text(json.dumps(ship_doc))
+    (tmp_path / "upgrades").mkdir()
+    (tmp_path / "upgrades" / "modification.json").write_text(
+        json.dumps([{"name": "Afterburners", "xws": "afterburners"}])
+    )
+    (tmp_path / "factions").mkdir()
+    (tmp_path / "factions" / "factions.json").write_text(
+        json.dumps(MOCK_FACTION_DOCS)
+    )
+
+    backend = EmbeddedBackend(Catalog(), str(tmp_path))
+    assert backend.load() is True
+    assert backend.find_pilot("oldteroch").initiative == 5
+    resolved = backend.find_pilots_with_ships_many(["fennrau"])
+    assert resolved["fennrau"].ship == ShipRecord(
+        xws="fangfighter", name="Fang Fighter", size="small", agility=3
+    )
+    assert backend.find_upgrade("afterburners").name == "Afterburners"
+    assert backend.find_faction("scumandvillainy") is not None
+    assert backend.data_version()["tree_hash"]
+
+
+def test_embedded_backend_missing_data_dir(tmp_path):
+    from bot.mongo.backends import EmbeddedBackend
+
+    backend = EmbeddedBackend(Catalog(), str(tmp_path / "missing"))
+    assert backend.load() is False
+    assert backend.data_version() is None
+
+
+def test_find_pilot_document_returns_full_documents(mocker, tmp_path):
+    from bot.mongo import backends
+    from bot.mongo.backends import EmbeddedBackend, MongoBackend
+
+    pilot_doc = {"xws": "oldteroch", "ability": "...", "slots": ["Talent"]}
+    ship_dir = tmp_path / "pilots" / "scum-and-villainy"
+    ship_dir.mkdir(parents=True)
+    (ship_dir / "fang-fighter.json").write_text(
+        json.dumps({"xws": "fangfighter", "pilots": [pilot_doc]})
+    )
+    embedded = EmbeddedBackend(Catalog(), str(tmp_path))
+    read = mocker.spy(backends, "read_documents")
+    assert embedded.find_pilot_document("oldteroch") == pilot_doc
+    assert embedded.find_pilot_document("nobody") is None
+    # Indexed on first use, never re-parsed per lookup
+    assert read.call_count == 1
+    assert embedded.load() is True
+    assert embedded.find_pilot_document("oldteroch") == pilot_doc
+    assert [c.args[0] for c in read.call_args_list].count("pilots") == 2
+
+    pilots = mocker.patch("bot.mongo.backends.get_collection").return_value
+    pilots.find_one.return_value = {"pilots": [pilot_doc]}
+    assert MongoBackend(Catalog()).find_pilot_document("oldteroch") == (
+        pilot_doc
+    )
+    pilots.find_one.assert_called_once_with(
+        {"pilots.xws": "oldteroch"}, {"pilots.$": 1, "_id": 0}
+    )
+
+
+def test_incomplete_backend_cannot_be_created():
+    from bot.mongo.backends import StorageBackend
+
+    class LoadOnlyBackend(StorageBackend):
+        def load(self):
+            return True
+
+    with pytest.raises(TypeError, match="abstract"):
+        LoadOnlyBackend()
+
+
+def test_build_cost_table_normalizes_variable_costs():
+    table = build_cost_table(
+        {"variable": "initiative", "values": {"1": "2", "x": 3, "6": "?"}}
+    )
+    assert table.values == {1: 2}
+    assert table.lookup(initiative="1") == 2
+    assert build_cost_table({"variable": "hull", "values": {}}) is None
+    assert build_cost_table({"value": "abc"}) is None
+
+
+def test_catalog_price_many():
+    catalog = make_catalog()
+    costs = catalog.price_many(
+        [
+            ("afterburners", "small", 3, 5),
+            ("stealthdevice", "small", 3, 5),
+            ("stealthdevice", "large", 0, 1),
+            ("unknown", "small", 2, 1),
+        ]
+    )
+    assert costs == [3, 8, 3, None]
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "catalog.snapshot")
+    version = {"release": "1.0", "tree_hash": "abc"}
+    snapshot.write_snapshot(make_catalog(), path, version)
+    restored = Catalog()
+    assert snapshot.load_snapshot(restored, path, version) is True
+    assert restored.loaded is True
+    assert restored.pilots == make_catalog().pilots
+    assert restored.upgrades["stealthdevice"].cost.lookup(agility=2) == 6
+
+
+def test_snapshot_failed_write_keeps_the_previous_file(mocker, tmp_path):
+    path = str(tmp_path / "catalog.snapshot")
+    version = {"tree_hash": "abc"}
+    snapshot.write_snapshot(make_catalog(), path, version)
+    mocker.patch.object(snapshot.pickle, "dump", side_effect=OSError("full"))
+    with pytest.raises(OSError):
+        snapshot.write_snapshot(make_catalog(), path, version)
+    assert os.listdir(tmp_path) == ["catalog.snapshot"]
+    assert snapshot.load_snapshot(Catalog(), path, version) is True
+
+
+def test_snapshot_rejects_other_data_version(tmp_path):
+    path = str(tmp_path / "catalog.snapshot")
+    snapshot.write_snapshot(make_catalog(), path, {"tree_hash": "old"})
+    restored = Catalog()
+    assert snapshot.load_snapshot(restored, path, {"tree_hash": "new"}) is (
+        False
+    )
+    assert restored.loaded is False
+
+
+def test_snapshot_rejected_without_data_version(tmp_path):
+    path = str(tmp_path / "catalog.snapshot")
+    snapshot.write_snapshot(make_catalog(), path, {"tree_hash": "abc"})
+    restored = Catalog()
+    assert snapshot.load_snapshot(restored, path, None) is False
+    assert snapshot.load_snapshot(restored, path, {"release": "1"}) is False
+    assert restored.loaded is False
+
+
+def test_load_catalog_prefers_snapshot(mocker, tmp_path):
+    path = str(tmp_path / "catalog.snapshot")
+    version = {"release": "1.0", "tree_hash": "abc"}
+    snapshot.write_snapshot(make_catalog(), path, version)
+    mocker.patch.object(search.config, "CATALOG_SNAPSHOT_PATH", path)
+    restored = Catalog()
+    mocker.patch.object(search, "catalog", restored)
+    storage = mocker.patch.object(search, "get_storage_backend").return_value
+    storage.data_version.return_value = version
+    assert search.load_catalog() is True
+    assert restored.loaded is True
+    storage.load.assert_not_called()
+
+
+def test_load_catalog_skips_snapshot_of_other_data(mocker, tmp_path):
+    path = str(tmp_path / "catalog.snapshot")
+    snapshot.write_snapshot(make_catalog(), path, {"tree_hash": "old"})
+    mocker.patch.object(search.config, "CATALOG_SNAPSHOT_PATH", path)
+    storage = mocker.patch.object(search, "get_storage_backend").return_value
+    storage.data_version.return_value = None
+    storage.load.return_value = True
+    assert search.load_catalog() is True
+    storage.load.assert_called_once()
+
+
+def test_refresh_catalog_reloads_when_data_version_changes(mocker):
+    mocker.patch.object(search.config, "CATALOG_SNAPSHOT_PATH", "")
+    mocker.patch.object(search, "_loaded_version", None)
+    storage = mocker.patch.object(search, "get_storage_backend").return_value
+    storage.data_version.return_value = {"tree_hash": "a"}
+    storage.load.return_value = True
+    assert search.load_catalog() is True
+    assert search.refresh_catalog() is False
+    storage.load.assert_called_once()
+
+    # e.g. a rollback swapped another generation in
+    storage.data_version.return_value = {"tree_hash": "b"}
+    assert search.refresh_catalog() is True
+    assert storage.load.call_count == 2
+    assert search.refresh_catalog() is False
+
+
+def test_refresh_catalog_without_data_version(mocker):
+    mocker.patch.object(search, "_loaded_version", None)
+    storage = mocker.patch.object(search, "get_storage_backend").return_value
+    storage.data_version.return_value = None
+    assert search.refresh_catalog() is False
+    storage.load.assert_not_called()
+
+
+def test_records_keep_only_renderer_fields():
+    upgrade = UpgradeRecord.from_doc(
+        {
+            "name": "Afterburners",
+            "xws": "afterburners",
+            "cost": {"value": 3},
+            "sides": [{"image": "ab_img", "ability": "long text"}],
+        }
+    )
+    assert upgrade.to_dict() == {
+        "xws": "afterburners",
+        "name": "Afterburners",
+        "image": "ab_img",
+        "cost": {"value": 3},
+    }
+    pilot = PilotRecord.from_doc(
+        {"xws": "".join(["old", "teroch"]), "cost": "5", "ability": "..."}
+    )
+    assert pilot.cost == 5
+    assert pilot.xws is sys.intern("oldteroch")
+    assert not hasattr(pilot, "__dict__")
+
+
+# --- Async Lookups ---
+@pytest.mark.asyncio
+@pytest.mark.parametrize("in_memory", [False, True])
+async def test_async_lookups_use_the_executor_unless_in_memory(
+    mocker, in_memory
+):
+    mocker.patch.object(
+        search, "get_backend", return_value=MagicMock(in_memory=in_memory)
+    )
+    submit = mocker.spy(async_search._executor, "submit")
+    threads = []
+    mocker.patch.object(
+        search,
+        "find_upgrades_many",
+        side_effect=lambda ids: threads.append(threading.get_ident()) or {},
+    )
+    assert await async_search.find_upgrades_many(["afterburners"]) == {}
+    assert submit.called is not in_memory
+    # Database lookups must never block the event loop's thread
+    assert (threads[0] == threading.get_ident()) is in_memory
+
+
+# --- MongoDB Client ---
+@pytest.mark.parametrize("module", ["bot.mongo.search", "main"])
+def test_importing_does_not_create_the_client(tmp_path, module):
+    code = (
+        "import importlib, pymongo\n"
+        "def connect(*args, **kwargs):\n"
+        "    raise SystemExit('MongoClient created at import')\n"
+        "pymongo.MongoClient.__init__ = connect\n"
+        f"importlib.import_module('{module}')\n"
+        "from bot.mongo import client\n"
+        "assert client._client is None\n"
+    )
+    # Run from tmp_path so importing main keeps its log file out of the repo
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=tmp_path,
+        env={**os.environ, "PYTHONPATH": os.path.dirname(__file__)},
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+
+
+def test_get_client_applies_pool_settings(mocker):
+    from bot.mongo import client
+
+    mocker.patch.object(client, "_client", None)
+    mongo_client = mocker.patch.object(client, "MongoClient")
+    for setting, value in [
+        ("MONGO_MAX_POOL_SIZE", 7),
+        ("MONGO_MIN_POOL_SIZE", 2),
+        ("MONGO_SERVER_SELECTION_TIMEOUT_MS", 1500),
+        ("MONGO_CONNECT_TIMEOUT_MS", 1200),
+        ("MONGO_SOCKET_TIMEOUT_MS", 3000),
+    ]:
+        mocker.patch.object(client.config, setting, value)
+    assert client.get_client() is client.get_client()
+    mongo_client.assert_called_once_with(
+        client.config.MONGODB_URI,
+        server_api=ANY,
+        maxPoolSize=7,
+        minPoolSize=2,
+        serverSelectionTimeoutMS=1500,
+        connectTimeoutMS=1200,
+        socketTimeoutMS=3000,
+    )
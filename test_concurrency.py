@@ -0,0 +1,214 @@
+import asyncio
+
+import pytest
+
+from bot import metrics
+from bot.concurrency import (
+    CircuitBreaker,
+    CircuitOpenError,
+    FairScheduler,
+    LockRegistry,
+    OrderedLock,
+    QueueFullError,
+    SingleFlight,
+)
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_one_call():
+    flight = SingleFlight("test_flight")
+    calls = []
+    release = asyncio.Event()
+
+    async def load():
+        calls.append(1)
+        await release.wait()
+        return {"faction": "rebelalliance"}
+
+    waiters = [
+        asyncio.ensure_future(flight.do("list", load)) for _ in range(3)
+    ]
+    await asyncio.sleep(0)
+    assert len(flight) == 1
+    release.set()
+    results = await asyncio.gather(*waiters)
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert len(flight) == 0
+
+    await flight.do("list", load)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_errors_and_survives_cancellation():
+    flight = SingleFlight("test_flight")
+    release = asyncio.Event()
+
+    async def load():
+        await release.wait()
+        raise ValueError("upstream failed")
+
+    cancelled = asyncio.ensure_future(flight.do("list", load))
+    waiter = asyncio.ensure_future(flight.do("list", load))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.sleep(0)
+    release.set()
+    with pytest.raises(ValueError, match="upstream failed"):
+        await waiter
+    assert cancelled.cancelled()
+
+
+def test_circuit_breaker_half_opens_after_reset_timeout():
+    now = [0.0]
+    breaker = CircuitBreaker(
+        "test.breaker",
+        failure_threshold=2,
+        reset_timeout=10,
+        clock=lambda: now[0],
+    )
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    now[0] = 11.0
+    breaker.before_call()
+    assert breaker.state == breaker.HALF_OPEN
+    # Only one trial call at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+
+    now[0] = 22.0
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == breaker.CLOSED
+    assert breaker.failures == 0
+
+
+@pytest.mark.asyncio
+async def test_ordered_lock_enters_turns_in_the_order_taken():
+    lock = OrderedLock()
+    entered = []
+
+    async def job(name, delay, turn):
+        await asyncio.sleep(delay)
+        async with turn:
+            entered.append(name)
+
+    first, second, third = lock.turn(), lock.turn(), lock.turn()
+    assert lock.locked()
+    # The second job gives up before its turn; the third still waits
+    second.release()
+    await asyncio.gather(job("first", 0.02, first), job("third", 0, third))
+    assert entered == ["first", "third"]
+    assert not lock.locked()
+
+
+@pytest.mark.asyncio
+async def test_lock_registry_evicts_only_idle_locks():
+    registry = LockRegistry(OrderedLock, max_size=2)
+    busy = registry.get("busy").turn()
+    registry.get("idle")
+    registry.get("new")
+    assert len(registry) == 2
+    assert "idle" not in registry
+    # Nothing idle is left to evict but the newest lock is kept
+    registry.get("newer").turn()
+    assert "busy" in registry and "newer" in registry
+    busy.release()
+    registry.get("latest")
+    assert "busy" not in registry
+
+
+def make_scheduler(**limits):
+    settings = dict(
+        workers=1,
+        max_queued=10,
+        max_queued_per_guild=10,
+        per_guild=1,
+        per_user=1,
+        name="test_scheduler",
+    )
+    settings.update(limits)
+    return FairScheduler(**settings)
+
+
+@pytest.mark.asyncio
+async def test_scheduler_round_robins_between_guilds():
+    scheduler = make_scheduler()
+    started = []
+    release = asyncio.Event()
+
+    def job(name):
+        async def run():
+            started.append(name)
+            await release.wait()
+            return name
+
+        return run
+
+    submitted = [
+        asyncio.ensure_future(scheduler.submit(guild, user, job(name)))
+        for guild, user, name in (
+            ("spam", 1, "spam-1"),
+            ("spam", 2, "spam-2"),
+            ("spam", 3, "spam-3"),
+            ("quiet", 4, "quiet-1"),
+        )
+    ]
+    await asyncio.sleep(0)
+    assert (scheduler.running, scheduler.queued) == (1, 3)
+    release.set()
+    assert await asyncio.gather(*submitted) == [
+        "spam-1",
+        "spam-2",
+        "spam-3",
+        "quiet-1",
+    ]
+    # The quiet guild did not wait behind the whole spam backlog
+    assert started == ["spam-1", "quiet-1", "spam-2", "spam-3"]
+    assert (scheduler.running, scheduler.queued) == (0, 0)
+    assert metrics.snapshot()["test_scheduler.wait_seconds.count"] >= 4
+
+
+@pytest.mark.asyncio
+async def test_scheduler_caps_users_and_sheds_when_full():
+    scheduler = make_scheduler(workers=2, per_guild=2, max_queued=1)
+    release = asyncio.Event()
+
+    async def job():
+        await release.wait()
+
+    first = asyncio.ensure_future(scheduler.submit("g", "user", job))
+    second = asyncio.ensure_future(scheduler.submit("g", "user", job))
+    await asyncio.sleep(0)
+    # A free worker is left but the user is at its cap
+    assert (scheduler.running, scheduler.queued) == (1, 1)
+    with pytest.raises(QueueFullError):
+        await scheduler.submit("g", "other", job)
+    release.set()
+    await asyncio.gather(first, second)
+
+
+@pytest.mark.asyncio
+async def test_scheduler_drops_jobs_of_cancelled_submitters():
+    scheduler = make_scheduler()
+    release = asyncio.Event()
+
+    async def job():
+        await release.wait()
+
+    running = asyncio.ensure_future(scheduler.submit("g", 1, job))
+    waiting = asyncio.ensure_future(scheduler.submit("g", 2, job))
+    await asyncio.sleep(0)
+    waiting.cancel()
+    await asyncio.sleep(0)
+    assert scheduler.queued == 0
+    release.set()
+    await running
@@ -0,0 +1,528 @@
+import json
+import os
+from contextlib import nullcontext
+from unittest.mock import MagicMock
+
+import pytest
+
+from bot.mongo import init_db
+
+IXSCAN_EXPLAIN = {
+    "queryPlanner": {
+        "winningPlan": {
+            "stage": "FETCH",
+            "inputStage": {"stage": "IXSCAN", "indexName": "xws_1"},
+        }
+    }
+}
+COLLSCAN_EXPLAIN = {
+    "queryPlanner": {
+        "winningPlan": {"queryPlan": {"stage": "COLLSCAN"}},
+    }
+}
+
+
+def mock_db(mocker, explain):
+    client = mocker.patch("bot.mongo.init_db.MongoClient").return_value
+    db = MagicMock()
+    client.__getitem__.return_value = db
+    db.__getitem__.return_value.find.return_value.explain.return_value = (
+        explain
+    )
+    return db
+
+
+def route_collections(db, files_collection, collection):
+    """Serves IMPORT_FILES_COLLECTION and every data collection apart."""
+    db.__getitem__.side_effect = lambda name: (
+        files_collection
+        if name == init_db.IMPORT_FILES_COLLECTION
+        else collection
+    )
+
+
+def test_plan_stages_walks_nested_plans():
+    stages = list(init_db._plan_stages(IXSCAN_EXPLAIN["queryPlanner"]))
+    assert stages == ["FETCH", "IXSCAN"]
+
+
+def test_verify_query_plans_passes_with_indexes(mocker):
+    mock_db(mocker, IXSCAN_EXPLAIN)
+    init_db.verify_query_plans("mongodb://test")
+
+
+def test_verify_query_plans_fails_on_collscan(mocker):
+    mock_db(mocker, COLLSCAN_EXPLAIN)
+    with pytest.raises(RuntimeError, match="collection scan"):
+        init_db.verify_query_plans("mongodb://test")
+
+
+def test_ensure_indexes_creates_every_index(mocker):
+    db = mock_db(mocker, IXSCAN_EXPLAIN)
+    init_db.ensure_indexes("mongodb://test")
+    create_index = db.__getitem__.return_value.create_index
+    assert create_index.call_count == len(init_db.COLLECTION_INDEXES)
+
+
+def test_build_pilot_card_flattens_ship_and_faction():
+    ship = {
+        "name": "Fang Fighter",
+        "xws": "fangfighter",
+        "size": "small",
+        "faction": "Scum and Villainy",
+        "stats": [{"type": "agility", "value": 3}],
+        "dial": ["1TW"],
+        "pilots": [],
+    }
+    pilot = {"name": "Old Teroch", "xws": "oldteroch", "initiative": 5}
+    faction = {"name": "Scum and Villainy", "xws": "scumandvillainy"}
+    card = init_db.build_pilot_card(ship, pilot, faction)
+    assert card["_id"] == "oldteroch"
+    assert card["pilot"] is pilot
+    assert set(card["ship"]) == set(init_db.PILOT_CARD_SHIP_FIELDS)
+    assert card["faction"] == {
+        "xws": "scumandvillainy",
+        "name": "Scum and Villainy",
+        "color": 0x253A21,
+    }
+    assert card["ini_emoji_key"] == 5
+
+
+def test_build_pilot_cards_without_pilots_drops_live_cards():
+    db = MagicMock()
+    db.__getitem__.return_value.find.return_value = []
+    init_db._build_pilot_cards(db)
+    db.drop_collection.assert_called_once_with(init_db.PILOT_CARDS_COLLECTION)
+    db.__getitem__.return_value.rename.assert_not_called()
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_import_collections_parses_once_and_bulk_writes(
+    mocker, tmp_path, workers
+):
+    mocker.patch("bot.mongo.init_db.config.IMPORT_WORKERS", workers)
+    mocker.patch("bot.mongo.init_db.config.IMPORT_BATCH_SIZE", 2)
+    (tmp_path / "upgrades").mkdir()
+    (tmp_path / "upgrades" / "talent.json").write_text(
+        json.dumps([{"xws": "a"}, {"xws": "b"}, {"xws": "c"}])
+    )
+    (tmp_path / "upgrades" / "broken.json").write_text("{not json")
+    (tmp_path / "factions").mkdir()
+    (tmp_path / "factions" / "scum.json").write_text(json.dumps({"xws": "s"}))
+
+    db = MagicMock()
+    db.list_collection_names.return_value = ["factions"]
+    files_collection, collection = MagicMock(), MagicMock()
+    route_collections(db, files_collection, collection)
+    collection.bulk_write.side_effect = lambda batch, ordered: MagicMock(
+        inserted_count=len(batch)
+    )
+
+    stats = init_db._import_collections(
+        db, str(tmp_path), ["upgrades", "factions"]
+    )
+    assert list(stats) == ["upgrades"]
+    assert stats["upgrades"][0] == 3
+    assert collection.bulk_write.call_count == 2
+    assert all(
+        c.kwargs["ordered"] is False
+        for c in collection.bulk_write.call_args_list
+    )
+    file_records = files_collection.bulk_write.call_args[0][0]
+    assert sorted(op._filter["_id"] for op in file_records) == [
+        "upgrades/broken.json",
+        "upgrades/talent.json",
+    ]
+
+
+def test_diff_cards_reports_pilot_changes():
+    old = [
+        {
+            "_id": "x",
+            "pilots": [
+                {"xws": "oldteroch", "cost": 5},
+                {"xws": "fennrau", "cost": 6},
+            ],
+        }
+    ]
+    new = [
+        {
+            "pilots": [
+                {"xws": "oldteroch", "cost": 4},
+                {"xws": "joyrekkoff", "cost": 4},
+            ]
+        }
+    ]
+    assert init_db.diff_cards("pilots", old, new) == {
+        "added": ["joyrekkoff"],
+        "changed": ["oldteroch"],
+        "removed": ["fennrau"],
+    }
+
+
+def test_sync_collection_reimports_only_changed_files(tmp_path):
+    (tmp_path / "upgrades").mkdir()
+    unchanged = tmp_path / "upgrades" / "talent.json"
+    unchanged.write_text(json.dumps([{"xws": "a"}]))
+    changed = tmp_path / "upgrades" / "crew.json"
+    changed.write_text(json.dumps([{"xws": "b", "cost": {"value": 4}}]))
+    records = [
+        {
+            "_id": "upgrades/talent.json",
+            "hash": init_db.hash_data_file(str(unchanged)),
+            "doc_ids": ["id-a"],
+        },
+        {"_id": "upgrades/crew.json", "hash": "stale", "doc_ids": ["id-b"]},
+        {"_id": "upgrades/gone.json", "hash": "gone", "doc_ids": ["id-c"]},
+    ]
+    db = MagicMock()
+    files_collection, upgrades = MagicMock(), MagicMock()
+    route_collections(db, files_collection, upgrades)
+    files_collection.find.return_value = records
+    upgrades.find.return_value = [
+        {"_id": "id-b", "xws": "b", "cost": {"value": 3}},
+        {"_id": "id-c", "xws": "c"},
+    ]
+    upgrades.bulk_write.side_effect = lambda batch, ordered: MagicMock(
+        inserted_count=len(batch)
+    )
+
+    report = init_db._sync_collection(db, "upgrades", str(tmp_path), None)
+
+    stale = {"_id": {"$in": ["id-b", "id-c"]}}
+    upgrades.find.assert_called_once_with(stale)
+    upgrades.delete_many.assert_called_once_with(stale)
+    files_collection.delete_many.assert_called_once_with(
+        {"_id": {"$in": ["upgrades/gone.json"]}}
+    )
+    inserted = [op._doc["xws"] for op in upgrades.bulk_write.call_args[0][0]]
+    assert inserted == ["b"]
+    assert report == {
+        "files_changed": 1,
+        "files_removed": 1,
+        "added": [],
+        "changed": ["b"],
+        "removed": ["c"],
+        "documents": 1,
+    }
+
+
+def test_sync_collection_skips_unchanged_files(tmp_path):
+    (tmp_path / "factions").mkdir()
+    path = tmp_path / "factions" / "factions.json"
+    path.write_text(json.dumps([{"xws": "s"}]))
+    db = MagicMock()
+    db.__getitem__.return_value.find.return_value = [
+        {
+            "_id": "factions/factions.json",
+            "hash": init_db.hash_data_file(str(path)),
+            "doc_ids": ["id-s"],
+        }
+    ]
+    assert (
+        init_db._sync_collection(db, "factions", str(tmp_path), None) is None
+    )
+    db.__getitem__.return_value.delete_many.assert_not_called()
+
+
+def test_staging_database_maps_to_next_generation():
+    db = MagicMock()
+    db.list_collection_names.return_value = ["pilots", "pilots_next"]
+    staged = init_db._StagingDatabase(db)
+    staged["pilots"]
+    db.__getitem__.assert_called_with("pilots_next")
+    assert staged.list_collection_names() == ["pilots"]
+
+
+def test_staging_database_shares_unstaged_collections():
+    db = MagicMock()
+    db.list_collection_names.return_value = ["upgrades", "pilots_next"]
+    staged = init_db._StagingDatabase(db, ["pilots"])
+    staged["upgrades"]
+    db.__getitem__.assert_called_with("upgrades")
+    assert staged.list_collection_names() == ["pilots", "upgrades"]
+
+
+def route_by_name(db):
+    """Gives every collection of a mocked database its own mock."""
+    collections = {}
+    db.__getitem__.side_effect = lambda name: collections.setdefault(
+        name, MagicMock(name=name)
+    )
+    return collections
+
+
+class GenerationDatabase:
+    """Tracks which collections exist through renames, copies and drops.
+
+    Collections hold a label standing for their content. After every
+    operation all live names present at the start must still exist.
+    """
+
+    def __init__(self, collections):
+        self.collections = dict(collections)
+        self.live = {
+            name
+            for name in self.collections
+            if name in init_db.GENERATION_COLLECTIONS
+        }
+        self.operations = []
+
+    def _check(self, operation):
+        self.operations.append(operation)
+        missing = self.live - set(self.collections)
+        assert not missing, f"{missing} missing after {operation}"
+
+    def list_collection_names(self):
+        return list(self.collections)
+
+    def drop_collection(self, name):
+        self.collections.pop(name, None)
+        self._check(("drop", name))
+
+    def __getitem__(self, name):
+        db = self
+
+        class Collection:
+            def rename(self, target, dropTarget=False):
+                assert dropTarget or target not in db.collections
+                db.collections[target] = db.collections.pop(name)
+                db._check(("rename", name, target))
+
+            def aggregate(self, pipeline):
+                (stage,) = pipeline
+                db.collections[stage["$out"]] = db.collections[name]
+                db._check(("copy", name, stage["$out"]))
+
+        return Collection()
+
+
+def test_swap_generation_keeps_every_live_collection():
+    db = GenerationDatabase(
+        {
+            "pilots": "old",
+            "pilots_next": "new",
+            "upgrades": "old",
+            init_db.MANIFEST_COLLECTION: "old",
+            init_db.MANIFEST_COLLECTION + "_next": "new",
+        }
+    )
+    init_db._swap_generation(db)
+    assert db.collections == {
+        "pilots": "new",
+        "pilots_previous": "old",
+        "upgrades": "old",
+        init_db.MANIFEST_COLLECTION: "new",
+        init_db.MANIFEST_COLLECTION + "_previous": "old",
+    }
+
+
+def test_swap_generation_swaps_the_manifest_last():
+    db = MagicMock()
+    db.list_collection_names.return_value = [
+        name + suffix
+        for name in init_db.GENERATION_COLLECTIONS
+        for suffix in ("", init_db.STAGING_SUFFIX)
+    ]
+    renamed = []
+    db.__getitem__.side_effect = lambda name: MagicMock(
+        rename=lambda target, **kwargs: renamed.append(target)
+    )
+    init_db._swap_generation(db)
+    assert renamed[-1] == init_db.MANIFEST_COLLECTION
+
+
+def test_swap_generation_drops_previous_of_unstaged_collections():
+    db = MagicMock()
+    db.list_collection_names.return_value = [
+        "pilots",
+        "pilots_next",
+        "upgrades",
+        "upgrades_previous",
+    ]
+    collections = route_by_name(db)
+    init_db._swap_generation(db)
+    db.drop_collection.assert_called_once_with("upgrades_previous")
+    assert "upgrades" not in collections
+
+
+def test_rollback_collections_keeps_every_live_collection(mocker):
+    db = GenerationDatabase(
+        {
+            "pilots": "new",
+            "pilots_previous": "old",
+            "upgrades": "new",
+            init_db.MANIFEST_COLLECTION: "new",
+            init_db.MANIFEST_COLLECTION + "_previous": "old",
+        }
+    )
+    mocker.patch.object(init_db, "_xws_database", return_value=nullcontext(db))
+    ensure_indexes = mocker.patch.object(init_db, "_ensure_indexes")
+    assert init_db.rollback_collections("mongodb://test") == [
+        "pilots",
+        init_db.MANIFEST_COLLECTION,
+    ]
+    assert db.collections == {
+        "pilots": "old",
+        "pilots_previous": "new",
+        "upgrades": "new",
+        init_db.MANIFEST_COLLECTION: "old",
+        init_db.MANIFEST_COLLECTION + "_previous": "new",
+    }
+    ensure_indexes.assert_called_once_with(db)
+
+
+def test_validate_generation_rejects_empty_collections():
+    staged = MagicMock()
+    staged.__getitem__.return_value.estimated_document_count.return_value = 0
+    with pytest.raises(RuntimeError, match="incomplete"):
+        init_db._validate_generation(staged)
+
+
+def test_rollback_collections_without_previous_generation(mocker):
+    db = mock_db(mocker, IXSCAN_EXPLAIN)
+    db.list_collection_names.return_value = ["pilots"]
+    with pytest.raises(RuntimeError, match="No previous"):
+        init_db.rollback_collections("mongodb://test")
+
+
+def test_data_version_tracks_file_content(tmp_path):
+    (tmp_path / "data" / "factions").mkdir(parents=True)
+    (tmp_path / "package.json").write_text(json.dumps({"version": "1.2.3"}))
+    factions = tmp_path / "data" / "factions" / "factions.json"
+    factions.write_text(json.dumps([{"xws": "s"}]))
+    version = init_db.data_version(str(tmp_path / "data"))
+    assert version["release"] == "1.2.3"
+    assert version["schema_version"] == init_db.SCHEMA_VERSION
+    assert init_db.data_version(str(tmp_path / "data")) == version
+    factions.write_text(json.dumps([{"xws": "r"}]))
+    assert init_db.data_version(str(tmp_path / "data")) != version
+
+
+def test_data_fingerprint_tracks_file_stats(tmp_path):
+    (tmp_path / "factions").mkdir()
+    factions = tmp_path / "factions" / "factions.json"
+    factions.write_text(json.dumps([{"xws": "s"}]))
+    fingerprint = init_db.data_fingerprint(str(tmp_path))
+    assert init_db.data_fingerprint(str(tmp_path)) == fingerprint
+    os.utime(factions, ns=(0, 0))
+    assert init_db.data_fingerprint(str(tmp_path)) != fingerprint
+
+
+def test_prepare_collections_skips_hashing_when_fingerprint_matches(
+    mocker, tmp_path
+):
+    db = mock_db(mocker, IXSCAN_EXPLAIN)
+    db.__getitem__.return_value.find_one.return_value = {
+        "_id": init_db.MANIFEST_ID,
+        "schema_version": init_db.SCHEMA_VERSION,
+        "fingerprint": init_db.data_fingerprint(str(tmp_path)),
+    }
+    version = mocker.spy(init_db, "data_version")
+    assert init_db.prepare_collections(str(tmp_path), "mongodb://test") == {}
+    version.assert_not_called()
+    db.list_collection_names.assert_not_called()
+
+
+def test_prepare_collections_skips_import_when_manifest_matches(
+    mocker, tmp_path
+):
+    version = init_db.data_version(str(tmp_path))
+    db = mock_db(mocker, IXSCAN_EXPLAIN)
+    manifest = db.__getitem__.return_value
+    manifest.find_one.return_value = {
+        "_id": init_db.MANIFEST_ID,
+        **version,
+        "fingerprint": "touched",
+    }
+    assert init_db.prepare_collections(str(tmp_path), "mongodb://test") == {}
+    manifest.update_one.assert_called_once_with(
+        {"_id": init_db.MANIFEST_ID},
+        {"$set": {"fingerprint": init_db.data_fingerprint(str(tmp_path))}},
+    )
+    manifest.replace_one.assert_not_called()
+    db.list_collection_names.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "existing, reloaded", [(["pilots", "upgrades"], True), ([], False)]
+)
+def test_prepare_collections_without_manifest(
+    mocker, tmp_path, existing, reloaded
+):
+    db = mock_db(mocker, IXSCAN_EXPLAIN)
+    db.__getitem__.return_value.find_one.return_value = None
+    db.list_collection_names.return_value = existing
+    reload = mocker.patch.object(
+        init_db, "_reload_collections", return_value={}
+    )
+    imported = mocker.patch.object(
+        init_db, "_import_collections", return_value={}
+    )
+    mocker.patch.object(init_db, "_build_pilot_cards")
+    init_db.prepare_collections(str(tmp_path), "mongodb://test")
+    assert reload.called is reloaded
+    assert imported.called is not reloaded
+
+
+def test_reload_collections_without_changes_writes_nothing(mocker, tmp_path):
+    version = init_db.data_version(str(tmp_path))
+    db = MagicMock()
+    db.__getitem__.return_value.find_one.return_value = {
+        "_id": init_db.MANIFEST_ID,
+        **version,
+    }
+    mocker.patch.object(init_db, "_collection_changes", return_value=None)
+    stage = mocker.patch.object(init_db, "_stage_generation")
+    assert init_db._reload_collections(db, str(tmp_path), version) == {}
+    stage.assert_not_called()
+    db.drop_collection.assert_not_called()
+    db.__getitem__.return_value.replace_one.assert_not_called()
+
+
+def test_reload_collections_stages_only_changed_collections(mocker, tmp_path):
+    db = MagicMock()
+    db.list_collection_names.return_value = list(
+        init_db.GENERATION_COLLECTIONS
+    )
+    collections = route_by_name(db)
+    upgrade_changes = ({}, ["upgrades/crew.json"], {}, [])
+    mocker.patch.object(
+        init_db,
+        "_collection_changes",
+        side_effect=lambda db, name, data_dir: (
+            upgrade_changes if name == "upgrades" else None
+        ),
+    )
+    sync = mocker.patch.object(
+        init_db, "_sync_collection", return_value={"files_changed": 1}
+    )
+    build_cards = mocker.patch.object(init_db, "_build_pilot_cards")
+    for helper in (
+        "_ensure_indexes",
+        "_verify_query_plans",
+        "_validate_generation",
+        "_write_manifest",
+        "_print_reload_report",
+    ):
+        mocker.patch.object(init_db, helper)
+    swap = mocker.patch.object(init_db, "_swap_generation")
+
+    report = init_db._reload_collections(db, str(tmp_path), {})
+
+    assert report == {"upgrades": {"files_changed": 1}}
+    cloned = {
+        name
+        for name, collection in collections.items()
+        if collection.aggregate.called
+    }
+    assert cloned == {"upgrades", init_db.IMPORT_FILES_COLLECTION}
+    staged_db = sync.call_args[0][0]
+    assert staged_db.staged == {
+        "upgrades",
+        init_db.IMPORT_FILES_COLLECTION,
+        init_db.MANIFEST_COLLECTION,
+    }
+    assert sync.call_args[0][-1] is upgrade_changes
+    build_cards.assert_not_called()
+    swap.assert_called_once_with(db)
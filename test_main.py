@@ -1,3 +1,4 @@
+import asyncio
 import json
 import re
 from unittest.mock import ANY, AsyncMock, MagicMock
@@ -6,6 +7,9 @@ import discord
 import pytest
 
 import main
+from bot.concurrency import LockRegistry, OrderedLock
+from bot.mongo.models import PilotRecord, ShipRecord, UpgradeRecord
+from bot.xws_cache import XwsCache
 
 # --- Constants  ---
 CORRECT_RB_ENDPOINT = (
@@ -349,8 +353,17 @@ def test_get_ship_stat_value(stats_list, stat_type, expected_value):
 def test_calculate_upgrade_cost(
     upgrade_data, ship_details, pilot_info, expected_cost
 ):
+    upgrade = (
+        UpgradeRecord.from_doc(upgrade_data)
+        if upgrade_data is not None
+        else None
+    )
     assert (
-        main.calculate_upgrade_cost(upgrade_data, ship_details, pilot_info)
+        main.calculate_upgrade_cost(
+            upgrade,
+            ShipRecord.from_doc(ship_details),
+            PilotRecord.from_doc(pilot_info),
+        )
         == expected_cost
     )
 
@@ -374,11 +387,24 @@ def mock_view_objects():
     mock_interaction.response.send_message = AsyncMock()
     mock_interaction.followup = AsyncMock(spec=main.discord.Webhook)
     mock_interaction.followup.send = AsyncMock()
-    mock_interaction.delete_original_response = AsyncMock()
     mock_interaction.channel_id = 9876
     return mock_original_message, mock_interaction
 
 
+def attach_list_message(view):
+    """Attaches the view to a list message, as send_lists does."""
+    list_message = AsyncMock(spec=main.discord.Message)
+    list_message.embeds = [discord.Embed(description="list")]
+    view.button_message = list_message
+    return list_message
+
+
+def assert_list_kept(list_message, mock_interaction):
+    list_message.edit.assert_awaited_once_with(content=None, view=None)
+    list_message.delete.assert_not_called()
+    mock_interaction.delete_original_response.assert_not_called()
+
+
 def find_button_callback(view, custom_id):
     for item in view.children:
         if isinstance(item, discord.ui.Button) and item.custom_id == custom_id:
@@ -413,12 +439,13 @@ async def test_confirmation_view_yes_button_callback_success(
     mock_original_message, mock_interaction = mock_view_objects
     mock_interaction.user.id = 12345
     view = main.ConfirmationView(original_message=mock_original_message)
+    list_message = attach_list_message(view)
     mocker.patch.object(view, "stop")
     yes_callback = find_button_callback(view, "confirm_delete_yes")
     await yes_callback(mock_interaction)
     mock_interaction.response.defer.assert_awaited_once_with(ephemeral=True)
     mock_original_message.delete.assert_awaited_once()
-    mock_interaction.delete_original_response.assert_awaited_once()
+    assert_list_kept(list_message, mock_interaction)
     mock_interaction.followup.send.assert_not_awaited()
     assert view.message_deleted is True
     view.stop.assert_called_once()
@@ -434,12 +461,13 @@ async def test_confirmation_view_yes_button_callback_forbidden(
         MagicMock(), "cannot delete"
     )
     view = main.ConfirmationView(original_message=mock_original_message)
+    list_message = attach_list_message(view)
     mocker.patch.object(view, "stop")
     yes_callback = find_button_callback(view, "confirm_delete_yes")
     await yes_callback(mock_interaction)
     mock_interaction.response.defer.assert_awaited_once_with(ephemeral=True)
     mock_original_message.delete.assert_awaited_once()
-    mock_interaction.delete_original_response.assert_awaited_once()
+    assert_list_kept(list_message, mock_interaction)
     mock_interaction.followup.send.assert_awaited_once_with(
         content=ANY, ephemeral=True
     )
@@ -456,12 +484,13 @@ async def test_confirmation_view_no_button_callback(mocker, mock_view_objects):
     mock_original_message, mock_interaction = mock_view_objects
     mock_interaction.user.id = 12345
     view = main.ConfirmationView(original_message=mock_original_message)
+    list_message = attach_list_message(view)
     mocker.patch.object(view, "stop")
     no_callback = find_button_callback(view, "confirm_delete_no")
     await no_callback(mock_interaction)
     mock_interaction.response.defer.assert_awaited_once_with(ephemeral=True)
     mock_original_message.delete.assert_not_awaited()
-    mock_interaction.delete_original_response.assert_awaited_once()
+    assert_list_kept(list_message, mock_interaction)
     mock_interaction.followup.send.assert_not_awaited()
     assert view.message_deleted is False
     view.stop.assert_called_once()
@@ -519,10 +548,10 @@ def mock_aiohttp_get(mocker):
     # session.get() returns the context manager, it's not awaited itself
     mock_session_get = MagicMock(return_value=mock_context_manager)
 
-    # Patch the session instance within the outer context manager
+    # Patch the shared RollBetter session
     mock_session_instance = mocker.patch(
-        "main.aiohttp.ClientSession"
-    ).return_value.__aenter__.return_value
+        "main.rollbetter.get_session"
+    ).return_value
     mock_session_instance.get = mock_session_get  # Assign the mock get method
 
     # Return the mock for session.get() and the mock_response for
@@ -531,47 +560,54 @@ def mock_aiohttp_get(mocker):
 
 
 def configure_scum_db_mocks(mocker):
-    mock_find_pilot = mocker.patch("main.find_pilot")
-    mock_find_ship = mocker.patch("main.find_ship_by_pilot")
-    mock_find_upgrade = mocker.patch("main.find_upgrade")
-    mocker.patch("main.find_faction", return_value=MOCK_SCUM_FACTION_DATA)
-
-    def find_pilot_se(pilot_id):
-        pilots = {
-            p["xws"]: p
-            for p in [
-                MOCK_OLDTEROCH_PILOT,
-                MOCK_SHADOWPORT_PILOT,
-                MOCK_FREIGHTER_PILOT,
-                MOCK_SPICERUNNER_PILOT,
+    mock_find_pilots = mocker.patch(
+        "main.find_pilots_with_ships_many", new_callable=AsyncMock
+    )
+    mock_find_upgrades = mocker.patch(
+        "main.find_upgrades_many", new_callable=AsyncMock
+    )
+    mocker.patch(
+        "main.find_faction",
+        new_callable=AsyncMock,
+        return_value=MOCK_SCUM_FACTION_DATA,
+    )
+
+    def find_pilots_se(pilot_ids):
+        pilots_and_ships = {
+            p["xws"]: PilotRecord.from_doc(p, ShipRecord.from_doc(ship))
+            for p, ship in [
+                (MOCK_OLDTEROCH_PILOT, MOCK_FANG_SHIP),
+                (MOCK_SHADOWPORT_PILOT, MOCK_LANCER_SHIP),
+                (MOCK_FREIGHTER_PILOT, MOCK_YT1300_SHIP),
+                (MOCK_SPICERUNNER_PILOT, MOCK_HWK_SHIP),
             ]
         }
-        return pilots.get(pilot_id)
-
-    def find_ship_se(pilot_xws):
-        ships = {
-            "oldteroch": MOCK_FANG_SHIP,
-            "shadowporthunter": MOCK_LANCER_SHIP,
-            "freightercaptain": MOCK_YT1300_SHIP,
-            "spicerunner": MOCK_HWK_SHIP,
+        return {
+            i: pilots_and_ships[i] for i in pilot_ids if i in pilots_and_ships
         }
-        return ships.get(pilot_xws)
 
-    def find_upgrade_se(upgrade_id):
+    def find_upgrades_se(upgrade_ids):
         upgrades = {
-            u["xws"]: u
+            u["xws"]: UpgradeRecord.from_doc(u)
             for u in [
                 MOCK_UPGRADE_AFTERBURNERS,
                 MOCK_UPGRADE_HULLUPGRADE,
                 MOCK_UPGRADE_MIGS,
             ]
         }
-        return upgrades.get(upgrade_id)
+        return {i: upgrades[i] for i in upgrade_ids if i in upgrades}
 
-    mock_find_pilot.side_effect = find_pilot_se
-    mock_find_ship.side_effect = find_ship_se
-    mock_find_upgrade.side_effect = find_upgrade_se
-    return mock_find_pilot, mock_find_ship, mock_find_upgrade
+    mock_find_pilots.side_effect = find_pilots_se
+    mock_find_upgrades.side_effect = find_upgrades_se
+    return mock_find_pilots, mock_find_upgrades
+
+
+@pytest.fixture(autouse=True)
+def memory_xws_cache(mocker):
+    """Keeps every test on an empty, memory-only XWS cache."""
+    cache = XwsCache(path=None)
+    mocker.patch("main.xws_cache", cache)
+    return cache
 
 
 @pytest.fixture(autouse=True)
@@ -584,7 +620,7 @@ def mock_bot_instance(mocker):
 
 @pytest.mark.asyncio
 async def test_on_message_scum_success(
-    mocker, mock_message, mock_aiohttp_get, mock_bot_instance
+    mocker, mock_message, mock_aiohttp_get, mock_bot_instance, memory_xws_cache
 ):
     # --- Setup Mocks ---
     mocker.patch("main.config.RB_ENDPOINT", CORRECT_RB_ENDPOINT)
@@ -611,48 +647,45 @@ async def test_on_message_scum_success(
         "main.ini_emojis", {1: "<:i1:123>", 2: "<:i2:123>", 5: "<:i5:123>"}
     )
     mock_confirmation_view = mocker.patch("main.ConfirmationView")
-    mock_find_pilot, mock_find_ship, mock_find_upgrade = (
-        configure_scum_db_mocks(mocker)
-    )
+    mock_find_pilots, mock_find_upgrades = configure_scum_db_mocks(mocker)
     mock_http_get, _ = mock_aiohttp_get
     correct_url = MOCK_XWS_RESPONSE_SCUM["vendor"]["yasb"]["link"]
     mock_message.content = f"List pls: {correct_url}"
-    mock_lock_instance = AsyncMock()
-    mocker.patch("asyncio.Lock", return_value=mock_lock_instance)
-    mocker.patch("main.channel_locks", {})
+    channel_locks = mocker.patch(
+        "main.channel_locks", LockRegistry(OrderedLock, max_size=8)
+    )
 
     # --- Run on_message ---
     await main.on_message(mock_message)
     # --- --- --- --- --- --
 
     # --- Assertions ---
-    mock_lock_instance.__aenter__.assert_awaited_once()
-    mock_http_get.assert_called_once_with(
-        CORRECT_RB_ENDPOINT + correct_url, timeout=20
+    mock_http_get.assert_called_once_with(CORRECT_RB_ENDPOINT + correct_url)
+    mock_find_pilots.assert_awaited_once_with(
+        ["oldteroch", "shadowporthunter", "freightercaptain", "spicerunner"]
     )
-    mock_find_pilot.assert_any_call("oldteroch")
-    embed_call = next(
-        (
-            c
-            for c in mock_message.channel.send.await_args_list
-            if isinstance(c.kwargs.get("embed"), discord.Embed)
-        ),
-        None,
+    mock_find_upgrades.assert_awaited_once_with(
+        ["afterburners", "hullupgrade", "migsmayfeld"]
     )
-    assert embed_call is not None, "Embed was not sent"
+    # The whole list and the buttons go out in a single message
+    mock_message.channel.send.assert_awaited_once()
+    send_call = mock_message.channel.send.await_args
+    embeds = send_call.kwargs["embeds"]
+    assert len(embeds) == 1 and isinstance(embeds[0], discord.Embed)
+    description = embeds[0].description
+    assert "[Afterburners](ab_img)(3)" in description
+    assert "__**[63]**__" in description
+    assert "__**[26]**__" in description
     mock_confirmation_view.assert_called_once_with(
         original_message=mock_message
     )
-    view_call = next(
-        (
-            c
-            for c in mock_message.channel.send.await_args_list
-            if isinstance(c.kwargs.get("view"), MagicMock)
-        ),
-        None,
-    )
-    assert view_call is not None, "Confirmation View message not sent"
-    mock_lock_instance.__aexit__.assert_awaited_once()
+    assert send_call.kwargs["view"] is mock_confirmation_view.return_value
+    assert not channel_locks.get(mock_message.channel.id).locked()
+
+    # A repeat paste is rendered from the cache
+    assert await memory_xws_cache.get(correct_url) == MOCK_XWS_RESPONSE_SCUM
+    await main.on_message(mock_message)
+    mock_http_get.assert_called_once()
 
 
 @pytest.mark.asyncio
@@ -669,8 +702,7 @@ async def test_on_message_http_error(
     mocker.patch("main.config.RB_ENDPOINT", CORRECT_RB_ENDPOINT)
     mocker.patch("main.config.YASB_URL_PATTERN", CORRECT_YASB_URL_PATTERN)
     mocker.patch("main.logging", autospec=True)
-    mocker.patch("main.channel_locks", {})
-    mocker.patch("asyncio.Lock", return_value=AsyncMock())
+    mocker.patch("main.channel_locks", LockRegistry(OrderedLock, max_size=8))
     mock_confirmation_view = mocker.patch("main.ConfirmationView")
     mock_http_get, mock_response = mock_aiohttp_get
     mock_response.status = 404
@@ -694,3 +726,182 @@ async def test_on_message_http_error(
     ]
     assert len(embed_send_calls) == 0
     mock_confirmation_view.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_on_message_replies_in_arrival_order(mocker, mock_message):
+    mocker.patch("main.channel_locks", LockRegistry(OrderedLock, max_size=8))
+    slow_list_loaded = asyncio.Event()
+    sent = []
+
+    async def load_lists(found_urls, log_context):
+        if "Slow" in found_urls[0]:
+            await slow_list_loaded.wait()
+        return found_urls
+
+    async def send_lists(message, found_urls, results, log_context, skipped):
+        sent.extend(results)
+
+    mocker.patch("main.load_lists", side_effect=load_lists)
+    mocker.patch("main.send_lists", side_effect=send_lists)
+    slow, fast = MagicMock(), MagicMock()
+    for msg, name in ((slow, "Slow"), (fast, "Fast")):
+        msg.author = mock_message.author
+        msg.channel = mock_message.channel
+        msg.content = (
+            f"https://xwing-legacy.com/?f=Rebel&d=v8ZsZ200Z&sn={name}"
+        )
+
+    slow_task = asyncio.ensure_future(main.on_message(slow))
+    fast_task = asyncio.ensure_future(main.on_message(fast))
+    await asyncio.sleep(0.01)
+    # The fast list is loaded but waits for the slow one to be sent first
+    assert sent == []
+    assert main.load_lists.await_count == 2
+    slow_list_loaded.set()
+    await asyncio.gather(slow_task, fast_task)
+    assert [url.rsplit("=", 1)[1] for url in sent] == ["Slow", "Fast"]
+
+
+def test_find_yasb_urls_dedupes_links_to_the_same_list():
+    content = (
+        "mine: http://xwing-legacy.com/?f=Rebel&d=v8ZsZ200Z1XW&sn=A "
+        "again: https://xwing-legacy.com/preview/?f=Rebel&d=v8ZsZ200Z1XW&sn=A "
+        "theirs: https://xwing-legacy.com/?f=Rebel&d=v8ZsZ200Z2XW&sn=B "
+        "last: https://xwing-legacy.com/?f=Rebel&d=v8ZsZ200Z3XW&sn=C"
+    )
+    assert main.find_yasb_urls(content) == [
+        "https://xwing-legacy.com/?f=Rebel&d=v8ZsZ200Z1XW&sn=A",
+        "https://xwing-legacy.com/?f=Rebel&d=v8ZsZ200Z2XW&sn=B",
+        "https://xwing-legacy.com/?f=Rebel&d=v8ZsZ200Z3XW&sn=C",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_on_message_reports_links_over_the_limit(mocker, mock_message):
+    mocker.patch("main.config.MAX_LISTS_PER_MESSAGE", 2)
+    mocker.patch("main.channel_locks", LockRegistry(OrderedLock, max_size=8))
+    mocker.patch("main.load_lists", side_effect=lambda urls, ctx: urls)
+    send_lists = mocker.patch("main.send_lists")
+    mock_message.content = " ".join(
+        f"https://xwing-legacy.com/?f=Rebel&d=v8ZsZ200Z{n}XW" for n in range(4)
+    )
+    await main.on_message(mock_message)
+    message, found_urls, results, log_context, skipped = (
+        send_lists.await_args.args
+    )
+    assert len(found_urls) == 2
+    assert skipped == 2
+
+
+@pytest.mark.asyncio
+async def test_send_lists_tells_about_skipped_links(mock_message):
+    await main.send_lists(mock_message, [], [], {}, skipped=3)
+    mock_message.channel.send.assert_awaited_once()
+    notice = mock_message.channel.send.await_args.args[0]
+    assert "3 more list link(s) were skipped" in notice
+
+
+@pytest.mark.asyncio
+async def test_load_lists_shares_one_catalog_lookup(mocker):
+    mock_find_pilots, mock_find_upgrades = configure_scum_db_mocks(mocker)
+    second_list = {
+        "faction": "scumandvillainy",
+        "pilots": [
+            {"id": "spicerunner", "upgrades": {}},
+            {"id": "oldteroch", "upgrades": {"mod": ["hullupgrade"]}},
+        ],
+    }
+    link = "https://xwing-legacy.com/?f=Scum%20and%20Villainy&sn="
+    fetched = {
+        link + "one": MOCK_XWS_RESPONSE_SCUM,
+        link + "down": main.aiohttp.ClientConnectionError("down"),
+        link + "two": second_list,
+    }
+
+    async def fetch_list(url, log_context):
+        if isinstance(fetched[url], Exception):
+            raise fetched[url]
+        return fetched[url]
+
+    mocker.patch("main.fetch_list", side_effect=fetch_list)
+    results = await main.load_lists(list(fetched), {})
+
+    mock_find_pilots.assert_awaited_once_with(
+        ["oldteroch", "shadowporthunter", "freightercaptain", "spicerunner"]
+    )
+    mock_find_upgrades.assert_awaited_once_with(
+        ["afterburners", "hullupgrade", "migsmayfeld"]
+    )
+    main.find_faction.assert_awaited_once_with("scumandvillainy")
+    assert isinstance(results[1], main.aiohttp.ClientConnectionError)
+    xws_dict, faction_details, pilot_details = results[2]
+    assert xws_dict is second_list
+    assert faction_details == MOCK_SCUM_FACTION_DATA
+    assert [
+        (pilot.xws, len(upgrades)) for pilot, _, upgrades in pilot_details
+    ] == [("spicerunner", 0), ("oldteroch", 1)]
+
+
+def make_embed(description_length):
+    return discord.Embed(description="x" * description_length)
+
+
+@pytest.mark.parametrize(
+    "lengths, expected",
+    [
+        ([100] * 12, [10, 2]),
+        ([4000, 1500, 1000, 100], [2, 2]),
+        ([4096], [1]),
+        ([], []),
+    ],
+)
+def test_pack_embeds_respects_discord_limits(lengths, expected):
+    embeds = [make_embed(length) for length in lengths]
+    batches = main.pack_embeds(embeds)
+    assert [len(batch) for batch in batches] == expected
+    assert [embed for batch in batches for embed in batch] == embeds
+    assert all(sum(len(embed) for embed in b) <= 6000 for b in batches)
+
+
+@pytest.mark.asyncio
+async def test_confirmation_view_timeout_keeps_the_list(mock_view_objects):
+    mock_original_message, _ = mock_view_objects
+    view = main.ConfirmationView(original_message=mock_original_message)
+    list_message = AsyncMock(spec=main.discord.Message)
+    list_message.embeds = [make_embed(10)]
+    view.button_message = list_message
+    await view.on_timeout()
+    list_message.edit.assert_awaited_once_with(content=None, view=None)
+    list_message.delete.assert_not_called()
+
+
+# ========= Metrics Export Tests =========
+@pytest.mark.asyncio
+async def test_metrics_report_logs_the_snapshot(mocker):
+    mocker.patch.dict(
+        main.metrics.counters, {"xws_cache.misses": 3}, clear=True
+    )
+    mocker.patch.dict(main.metrics._timings, {}, clear=True)
+    main.metrics.observe("scheduler.wait_seconds", 0.25)
+    log = mocker.patch.object(main.logger, "info")
+    await main.metrics_report()
+    line = log.call_args[0][0]
+    assert "xws_cache.misses=3" in line
+    assert "rollbetter.breaker.state=closed" in line
+    assert "channel_locks.size=" in line
+    assert "scheduler.queued=0" in line
+    assert "scheduler.wait_seconds.max=0.250" in line
+
+
+@pytest.mark.asyncio
+async def test_metrics_command_responds_privately(mocker):
+    mocker.patch.dict(
+        main.metrics.counters, {"list_loads.calls": 2}, clear=True
+    )
+    ctx = AsyncMock()
+    await main.show_metrics.callback(ctx)
+    ctx.respond.assert_awaited_once_with(ANY, ephemeral=True)
+    report = ctx.respond.await_args[0][0]
+    assert "list_loads.calls=2\n" in report
+    assert len(report) <= 2000
@@ -0,0 +1,88 @@
+import json
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from bot import rollbetter
+
+
+def mock_response(mocker, payload, status=200):
+    response = AsyncMock()
+    response.status = status
+    response.raise_for_status = MagicMock()
+    response.text = AsyncMock(return_value=json.dumps(payload))
+    context = AsyncMock()
+    context.__aenter__.return_value = response
+    session = mocker.patch("bot.rollbetter.get_session").return_value
+    session.get = MagicMock(return_value=context)
+    return session, response
+
+
+@pytest.mark.asyncio
+async def test_session_is_shared_and_tuned():
+    session = rollbetter.get_session()
+    assert rollbetter.get_session() is session
+    assert session.connector.limit == rollbetter.config.RB_CONNECTION_LIMIT
+    await rollbetter.close_session()
+    assert session.closed
+    assert rollbetter.get_session() is not session
+    await rollbetter.close_session()
+
+
+@pytest.mark.asyncio
+async def test_fetch_xws_decodes_response(mocker):
+    mocker.patch.object(rollbetter.config, "RB_ENDPOINT", "https://rb/?")
+    session, _ = mock_response(mocker, {"faction": "rebelalliance"})
+    xws = await rollbetter.fetch_xws("https://yasb/?f=Rebel")
+    assert xws == {"faction": "rebelalliance"}
+    session.get.assert_called_once_with("https://rb/?https://yasb/?f=Rebel")
+
+
+def response_error(status):
+    return rollbetter.aiohttp.ClientResponseError(
+        MagicMock(), (), status=status, message="error"
+    )
+
+
+@pytest.fixture
+def fresh_breaker(mocker):
+    breaker = rollbetter.CircuitBreaker(
+        "test.breaker", failure_threshold=2, reset_timeout=60
+    )
+    mocker.patch.object(rollbetter, "breaker", breaker)
+    mocker.patch.object(rollbetter.config, "RB_RETRY_BASE_DELAY", 0)
+    return breaker
+
+
+@pytest.mark.asyncio
+async def test_fetch_xws_retries_overload_answers(mocker, fresh_breaker):
+    session, response = mock_response(mocker, {"faction": "rebelalliance"})
+    response.raise_for_status.side_effect = [response_error(503), None]
+    xws = await rollbetter.fetch_xws("https://yasb/?f=Rebel")
+    assert xws == {"faction": "rebelalliance"}
+    assert session.get.call_count == 2
+    assert fresh_breaker.state == fresh_breaker.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_fetch_xws_does_not_retry_rejected_lists(mocker, fresh_breaker):
+    session, response = mock_response(mocker, {})
+    response.raise_for_status.side_effect = response_error(404)
+    with pytest.raises(rollbetter.aiohttp.ClientResponseError):
+        await rollbetter.fetch_xws("https://yasb/?f=Rebel")
+    assert session.get.call_count == 1
+    assert fresh_breaker.failures == 0
+
+
+@pytest.mark.asyncio
+async def test_fetch_xws_fails_fast_once_breaker_opens(mocker, fresh_breaker):
+    session, response = mock_response(mocker, {})
+    response.raise_for_status.side_effect = response_error(502)
+    with pytest.raises(rollbetter.aiohttp.ClientResponseError):
+        await rollbetter.fetch_xws("https://yasb/?f=Rebel")
+    # The second failed attempt opened the breaker and stopped the retries
+    assert session.get.call_count == 2
+    assert fresh_breaker.state == fresh_breaker.OPEN
+    with pytest.raises(rollbetter.CircuitOpenError):
+        await rollbetter.fetch_xws("https://yasb/?f=Rebel")
+    assert session.get.call_count == 2
@@ -0,0 +1,101 @@
+import pytest
+
+from bot import metrics
+from bot.xws_cache import XwsCache, canonical_yasb_url
+
+URL = (
+    "https://xwing-legacy.com/?f=Scum%20and%20Villainy"
+    "&d=v8ZhZ250Z98XWW105Y230XWWWWW&sn=Squad&obs="
+)
+XWS = {"faction": "scumandvillainy", "pilots": [{"id": "oldteroch"}]}
+
+
+def test_canonical_yasb_url_ignores_cosmetic_differences():
+    variant = (
+        "http://XWING-LEGACY.com/preview/?sn=Squad"
+        "&f=Scum%20and%20Villainy&d=v8ZhZ250Z98XWW105Y230XWWWWW#top"
+    )
+    assert canonical_yasb_url(variant) == canonical_yasb_url(URL)
+    assert canonical_yasb_url(URL.replace("Squad", "Other")) != (
+        canonical_yasb_url(URL)
+    )
+
+
+@pytest.mark.asyncio
+async def test_memory_tier_evicts_least_recently_used():
+    cache = XwsCache(memory_entries=2)
+    await cache.put("https://xwing-legacy.com/?f=a", {"n": 1})
+    await cache.put("https://xwing-legacy.com/?f=b", {"n": 2})
+    assert await cache.get("https://xwing-legacy.com/?f=a") == {"n": 1}
+    await cache.put("https://xwing-legacy.com/?f=c", {"n": 3})
+    assert await cache.get("https://xwing-legacy.com/?f=b") is None
+    assert await cache.get("https://xwing-legacy.com/?f=a") == {"n": 1}
+    assert len(cache) == 2
+
+
+@pytest.mark.asyncio
+async def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = XwsCache(path=path)
+    await cache.put(URL, XWS)
+    cache.close()
+
+    hits = metrics.counters["xws_cache.disk_hits"]
+    restarted = XwsCache(path=path)
+    assert await restarted.get(URL) == XWS
+    assert metrics.counters["xws_cache.disk_hits"] == hits + 1
+    # Promoted to the memory tier
+    assert len(restarted) == 1
+    restarted.close()
+
+
+@pytest.mark.asyncio
+async def test_disk_tier_is_bounded_and_expires(tmp_path, mocker):
+    clock = mocker.patch("bot.xws_cache.time.time", return_value=1000.0)
+    cache = XwsCache(
+        path=str(tmp_path / "cache.sqlite3"),
+        memory_entries=0,
+        disk_entries=1,
+        ttl=60,
+    )
+    await cache.put("https://xwing-legacy.com/?f=a", {"n": 1})
+    clock.return_value = 1001.0
+    await cache.put("https://xwing-legacy.com/?f=b", {"n": 2})
+    assert await cache.get("https://xwing-legacy.com/?f=a") is None
+    assert await cache.get("https://xwing-legacy.com/?f=b") == {"n": 2}
+    clock.return_value = 1100.0
+    assert await cache.get("https://xwing-legacy.com/?f=b") is None
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_disk_tier_counts_rows_across_replaces_and_restarts(
+    tmp_path, mocker
+):
+    clock = mocker.patch("bot.xws_cache.time.time", return_value=1000.0)
+    path = str(tmp_path / "cache.sqlite3")
+    cache = XwsCache(path=path, memory_entries=0, disk_entries=2)
+    for n, name in enumerate("aba"):
+        clock.return_value = 1000.0 + n
+        await cache.put(f"https://xwing-legacy.com/?f={name}", {"n": n})
+    # Replacing a list does not add a row, nothing was evicted
+    assert cache._disk_count == 2
+    cache.close()
+
+    restarted = XwsCache(path=path, memory_entries=0, disk_entries=2)
+    clock.return_value = 1003.0
+    await restarted.put("https://xwing-legacy.com/?f=c", {"n": 3})
+    assert restarted._disk_count == 2
+    assert await restarted.get("https://xwing-legacy.com/?f=b") is None
+    assert await restarted.get("https://xwing-legacy.com/?f=a") == {"n": 2}
+    restarted.close()
+
+
+@pytest.mark.asyncio
+async def test_expired_entries_are_kept_as_fallback(mocker):
+    clock = mocker.patch("bot.xws_cache.time.time", return_value=1000.0)
+    cache = XwsCache(ttl=60)
+    await cache.put(URL, XWS)
+    clock.return_value = 2000.0
+    assert await cache.get(URL) is None
+    assert await cache.get(URL, allow_stale=True) == XWS